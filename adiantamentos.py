@@ -64,7 +64,7 @@ def run_dashboard():
         df_filtered = df_adiantamentos[
             (df_adiantamentos["ANO"].between(selected_ano[0], selected_ano[1])) &
             (df_adiantamentos["NUM_MES"].between(selected_mes[0], selected_mes[1])) &
-            (df_adiantamentos["UG"].astype(str).isin(map(str, selected_ugs)))
+            (df_adiantamentos["UG"].isin(selected_ugs))
         ].copy()
 
     # Exibir o subtítulo com a sigla da UG selecionada ou "TODOS ÓRGÃOS"
@@ -79,9 +79,6 @@ def run_dashboard():
         st.subheader("Evolução dos Adiantamentos ao Longo dos Anos")
 
         if not df_filtered.empty:
-            # Convertendo valores para float
-            df_filtered["VALOR_ADIANTAMENTOS_COMPROVADOS"] = df_filtered["VALOR_ADIANTAMENTOS_COMPROVADOS"].astype(float)
-
             # Agregar valores totais por ano
             df_evolucao = df_filtered.groupby("ANO")["VALOR_ADIANTAMENTOS_COMPROVADOS"].sum().reset_index()
 
@@ -216,10 +213,6 @@ def run_dashboard():
         st.subheader("Eficiência na Comprovação dos Adiantamentos")
 
         if not df_filtered.empty:
-            # Converter valores para float (caso ainda estejam como string)
-            df_filtered["VALOR_ADIANTAMENTOS_A_COMPROVAR"] = df_filtered["VALOR_ADIANTAMENTOS_A_COMPROVAR"].astype(float)
-            df_filtered["VALOR_ADIANTAMENTOS_COMPROVADOS"] = df_filtered["VALOR_ADIANTAMENTOS_COMPROVADOS"].astype(float)
-
             # Criar dataframe de comparação
             df_comprovacao = pd.DataFrame({
                 "Categoria": [
@@ -363,9 +356,6 @@ def run_dashboard():
     with tab3:
 
         if not df_filtered.empty:
-            # Converter colunas para float, se necessário
-            df_filtered["VALOR_ADIANTAMENTOS_COMPROVADOS"] = df_filtered["VALOR_ADIANTAMENTOS_COMPROVADOS"].astype(float)
-
             # ==================== GRÁFICO 1: TOP 10 CREDORES ====================
             #st.subheader("Top 10 Credores que Mais Receberam Adiantamentos")
 
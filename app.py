@@ -9,8 +9,13 @@ import adiantamentos  # Novo dashboard de Servidores
 import combustivel  # Novo dashboard de Servidores
 import orcamento  # Novo dashboard de Servidores
 import home  # Novo dashboard de Servidores
+import diagnostico  # Diagnóstico da carga de dados (apenas administradores)
 from sidebar import load_sidebar, navigate_pages
 import auth_utils  # Importar o módulo de autenticação
+from data_loader import start_warmup, get_warmup_status, is_warm
+
+# Aquecer as bases em segundo plano (uma vez por processo), depois que as páginas declararam suas colunas
+start_warmup()
 
 # Configuração da página
 st.set_page_config(layout="wide",
@@ -45,6 +50,12 @@ with st.container():
             unsafe_allow_html=True
         )
 
+# Informar enquanto as bases ainda estão sendo carregadas no servidor
+if not is_warm():
+    warmup_status = get_warmup_status()
+    prontas = sum(state == 'pronta' for state in warmup_status.values())
+    st.info(f"Preparando as bases de dados do painel ({prontas} de {len(warmup_status)} prontas)...")
+
 # Verifica se o usuário já está autenticado
 if 'authenticated' not in st.session_state:
     st.session_state['authenticated'] = False
@@ -69,3 +80,5 @@ else:
         combustivel.run_dashboard()
     elif selected_page == 'Orçamento': 
         orcamento.run_dashboard()
+    elif selected_page == 'Diagnóstico':
+        diagnostico.run_dashboard()
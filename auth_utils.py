@@ -10,9 +10,13 @@ def make_hashes(password):
 def check_hashes(password, hashed_text):
     return password == hashed_text  # Comparar diretamente se as senhas são em texto puro
 
+# Função para verificar se o usuário da sessão é administrador (lista ADMIN_USERS do secrets)
+def is_admin():
+    admins = {str(user).strip() for user in st.secrets.get('ADMIN_USERS', [])}
+    return st.session_state.get('authenticated', False) and st.session_state.get('username') in admins
+
 def load_users():
-    df = load_login_data()   
-    return df
+    return load_login_data()
 
 def login():
     st.markdown("<h1 style='text-align: center;'>Login</h1>", unsafe_allow_html=True)
@@ -31,10 +35,8 @@ def login():
 
 # Função de autenticação usando CSV
 def login_action(username, password):
-    users_df = load_users()
-
-    # Converter o 'username' para string e garantir que não tenha espaços em branco
-    users_df['username'] = users_df['username'].astype(str).str.strip()
+    # Credenciais em memória, indexadas pelo 'username' já convertido para string e sem espaços
+    users = load_users()
 
     # Garantir que a entrada do usuário também seja tratada como string e sem espaços
     username = username.strip()
@@ -43,12 +45,11 @@ def login_action(username, password):
         # Converter a senha digitada pelo usuário para inteiro
         password = int(password)
 
-        # Verificar se o usuário existe e se a senha está correta
-        user_row = users_df[users_df['username'] == username]
-
-        # Comparar a senha digitada (int) com a senha armazenada no CSV
-        if not user_row.empty and password == user_row.iloc[0]['password']:
+        # Verificar se o usuário existe e comparar a senha digitada (int) com a senha armazenada no CSV
+        stored_password = users.get(username)
+        if stored_password is not None and password == stored_password:
             st.session_state['authenticated'] = True
+            st.session_state['username'] = username
             placeholder = st.empty()  # Placeholder para a mensagem de sucesso
             placeholder.success("Login bem-sucedido!")
             time.sleep(3)  # Espera por 3 segundos
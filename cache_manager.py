@@ -0,0 +1,187 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import logging
+import sys
+import threading
+from collections import OrderedDict
+
+config = st.secrets
+
+# Teto de memória (em MB) para tudo o que fica em cache no processo: bases carregadas e itens derivados.
+# Bases não são descartadas (só são contabilizadas); ao passar do teto, os itens derivados menos usados saem.
+MEMORY_BUDGET_MB = float(config.get('MEMORY_BUDGET_MB', 2048))
+
+# Espaço mínimo (em MB) garantido aos itens derivados, mesmo quando as bases sozinhas já ocupam o teto
+# (sem ele, cada novo item descartaria todos os outros e os filtros e agregações seriam refeitos a cada interação)
+DERIVED_MIN_MB = float(config.get('DERIVED_MIN_MB', MEMORY_BUDGET_MB / 8))
+
+# Linhas amostradas por coluna de texto para estimar a memória ocupada pelas strings
+SIZE_SAMPLE_ROWS = 1000
+
+logger = logging.getLogger(__name__)
+
+# Itens derivados (montagens de anos e de cubos, índices, filtros e agregações): chave -> (valor, bytes),
+# do menos para o mais recentemente usado. O primeiro elemento da chave identifica o tipo do item.
+_derived = OrderedDict()
+
+# Bases carregadas (partições anuais com seus cubos e bases não anuais): chave -> bytes
+_datasets = {}
+
+_lock = threading.Lock()
+_stats = {'acertos': 0, 'faltas': 0, 'descartes': 0}
+_totals = {'bases': 0, 'derivados': 0}
+_warned = {'bases_acima_do_teto': False}
+
+# Função para normalizar uma seleção do sidebar em uma chave estável e hashable
+# (listas e conjuntos viram tuplas ordenadas, de modo que a ordem de seleção das UGs não muda a chave)
+def normalize_key(value):
+    if isinstance(value, dict):
+        return tuple(sorted((str(key), normalize_key(item)) for key, item in value.items()))
+    if isinstance(value, (list, set, frozenset)):
+        return tuple(sorted({normalize_key(item) for item in value}, key=repr))
+    if isinstance(value, tuple):
+        return tuple(normalize_key(item) for item in value)
+    if isinstance(value, range):
+        return ('range', value.start, value.stop, value.step)
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+# Função para estimar os bytes das strings de uma coluna de texto a partir de uma amostra de linhas
+# (memory_usage(deep=True) percorreria todas as strings, o que é caro em colunas com milhões de linhas)
+def _estimate_object_bytes(series):
+    if len(series) == 0:
+        return 0
+    sample = series.iloc[::max(1, len(series) // SIZE_SAMPLE_ROWS)]
+    per_row = (sample.memory_usage(deep=True, index=False) - sample.memory_usage(deep=False, index=False)) / len(sample)
+    return int(per_row * len(series))
+
+# Função para estimar a memória ocupada pelos valores de uma coluna (ou Series), sem o índice
+def _estimate_series_size(series):
+    size = int(series.memory_usage(index=False, deep=False))
+    if series.dtype == object:
+        size += _estimate_object_bytes(series)
+    elif isinstance(series.dtype, pd.CategoricalDtype) and series.cat.categories.dtype == object:
+        # O dicionário de categorias é pequeno: seus textos podem ser medidos por inteiro
+        categories = series.cat.categories
+        size += int(categories.memory_usage(deep=True) - categories.memory_usage(deep=False))
+    return size
+
+# Função para estimar a memória ocupada por um valor em cache
+def estimate_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.index.memory_usage()) + sum(_estimate_series_size(value.iloc[:, idx]) for idx in range(value.shape[1]))
+    if isinstance(value, pd.Series):
+        return int(value.index.memory_usage()) + _estimate_series_size(value)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+# Função que calcula quantos bytes os itens derivados podem ocupar: o que sobra do teto depois das bases,
+# mas nunca menos que DERIVED_MIN_MB
+def _derived_allowance():
+    budget = MEMORY_BUDGET_MB * 1024 * 1024
+    return max(budget - _totals['bases'], DERIVED_MIN_MB * 1024 * 1024)
+
+# Função que descarta os itens derivados menos usados até caberem no espaço disponível (chamada com o lock).
+# O item informado em keep (o que acabou de ser guardado) nunca é descartado.
+def _enforce_budget(keep=None):
+    allowance = _derived_allowance()
+    for key in list(_derived):
+        if _totals['derivados'] <= allowance:
+            break
+        if key == keep:
+            continue
+        _totals['derivados'] -= _derived.pop(key)[1]
+        _stats['descartes'] += 1
+
+# Função para obter um item derivado (None quando não está em cache)
+def get_cached(key):
+    with _lock:
+        if key not in _derived:
+            _stats['faltas'] += 1
+            return None
+        _derived.move_to_end(key)
+        _stats['acertos'] += 1
+        return _derived[key][0]
+
+# Função para guardar um item derivado, descartando os menos usados se o teto for ultrapassado.
+# Itens maiores que todo o espaço disponível para derivados não são guardados.
+def put_cached(key, value, size=None):
+    size = estimate_size(value) if size is None else size
+    with _lock:
+        if key in _derived:
+            _totals['derivados'] -= _derived.pop(key)[1]
+        if size > _derived_allowance():
+            return value
+        _derived[key] = (value, size)
+        _totals['derivados'] += size
+        _enforce_budget(keep=key)
+    return value
+
+# Função que devolve o resultado guardado para a chave ou o calcula, guarda e devolve.
+# As páginas montam a chave com a versão das bases usadas e a seleção do sidebar normalizada por normalize_key:
+# sessões com os mesmos filtros compartilham o resultado, e uma nova versão da base não reaproveita os antigos.
+# Com copy=True, DataFrames são devolvidos como cópia, para que a página possa alterá-los sem afetar outras sessões.
+def memoize(key, compute, copy=True):
+    value = get_cached(key)
+    if value is None:
+        value = put_cached(key, compute())
+    return value.copy() if copy and isinstance(value, pd.DataFrame) else value
+
+# Função para descartar os itens derivados cuja chave satisfaz o critério (ex.: montagens de anos alterados)
+def discard(predicate):
+    with _lock:
+        for key in [key for key in _derived if predicate(key)]:
+            _totals['derivados'] -= _derived.pop(key)[1]
+
+# Função para descartar os itens derivados (todos, ou apenas os que começam pelo prefixo informado)
+def clear_memo(prefix=None):
+    discard(lambda key: prefix is None or key[:len(prefix)] == tuple(prefix))
+
+# Função para contabilizar uma base carregada (substitui a contagem anterior da mesma chave).
+# O aviso de bases acima do teto é registrado uma vez, quando o teto é ultrapassado.
+def track_dataset(key, value):
+    size = estimate_size(value)
+    with _lock:
+        _totals['bases'] += size - _datasets.get(key, 0)
+        _datasets[key] = size
+        _enforce_budget()
+        over_budget = _totals['bases'] > MEMORY_BUDGET_MB * 1024 * 1024
+        warn = over_budget and not _warned['bases_acima_do_teto']
+        _warned['bases_acima_do_teto'] = over_budget
+    if warn:
+        logger.warning('As bases carregadas (%.0f MB) excedem o teto de memória do cache (%.0f MB); '
+                       'os itens derivados ficam limitados a %.0f MB',
+                       _totals['bases'] / 1024 / 1024, MEMORY_BUDGET_MB, DERIVED_MIN_MB)
+
+# Função para deixar de contabilizar uma base descartada
+def untrack_dataset(key):
+    with _lock:
+        _totals['bases'] -= _datasets.pop(key, 0)
+        _warned['bases_acima_do_teto'] = _totals['bases'] > MEMORY_BUDGET_MB * 1024 * 1024
+
+# Função para consultar o uso atual do cache (bytes de bases e derivados, teto, acertos, faltas e descartes)
+def get_cache_usage():
+    with _lock:
+        return dict(
+            _stats,
+            bases_bytes=_totals['bases'],
+            derivados_bytes=_totals['derivados'],
+            total_bytes=_totals['bases'] + _totals['derivados'],
+            teto_bytes=int(MEMORY_BUDGET_MB * 1024 * 1024),
+            itens_derivados=len(_derived),
+            bases=len(_datasets),
+        )
+
+# Função para detalhar o uso de memória por item (bases e derivados, agrupados pelo tipo do item)
+def get_cache_report():
+    with _lock:
+        rows = [{'tipo': 'base', 'item': str(key), 'bytes': size} for key, size in _datasets.items()]
+        rows += [{'tipo': str(key[0]), 'item': str(key[1:]), 'bytes': size} for key, (_, size) in _derived.items()]
+    return pd.DataFrame(rows, columns=['tipo', 'item', 'bytes'])
@@ -1,7 +1,10 @@
 import streamlit as st
 import locale
 from sidebar import load_sidebar
-from data_loader import load_data
+from data_loader import load_data, register_columns
+
+COLUNAS_DESPESAS = ['UG', 'ANO', 'MES']
+register_columns('despesas', COLUNAS_DESPESAS)
 
 # Configurar o locale para português do Brasil
 #locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
@@ -78,20 +78,7 @@ def run_dashboard():
     # Converter a coluna NOME_CONTRATO para maiúsculas
     df_contratos['NOME_CONTRATO'] = df_contratos['NOME_CONTRATO'].str.upper()
 
-    # Tratamento de dados
-    df_contratos['DATA_PUBLICACAO'] = pd.to_datetime(df_contratos['DATA_PUBLICACAO'], format='%d/%m/%Y', errors='coerce')
-
-    numeric_cols = ['UG', 'CODIGO_CONTRATANTE', 'CODIGO_CONTRATADA', 'CODIGO_CONTRATO', 'COD_TIPO_LICITACAO', 'COD_SITUACAO']
-    for col in numeric_cols:
-        df_contratos[col] = pd.to_numeric(df_contratos[col], errors='coerce')
-        
-    financial_cols = ['VALOR_CONCESSAO', 'VALOR_TOTAL', 'VALOR_MULTA', 'VALOR_GARANTIA', 'VALOR_ADITIVO']
-    for col in financial_cols:
-        df_contratos[col] = df_contratos[col].apply(pd.to_numeric, errors='coerce')
-
-    if df_contratos['VALOR_PERCENTUAL_TERCEIR'].dtype == 'object':
-        df_contratos['VALOR_PERCENTUAL_TERCEIR'] = df_contratos['VALOR_PERCENTUAL_TERCEIR'].str.replace('%', '').astype(float) / 100
-
+    # Datas, códigos, valores e percentuais já chegam tipados do estágio de normalização do data_loader
 
     # Adicionar métricas ao painel
     if "TODAS" in selected_ug_sigla_contratos:
@@ -1,399 +1,1477 @@
 import streamlit as st
 import pandas as pd
+import pyarrow as pa
 import pyarrow.parquet as pq
+from pandas.api.types import union_categoricals
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest, MediaIoBaseDownload
 from io import BytesIO
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
 import json
+import os
+import re
+import logging
+import threading
+import time
 import toml
+from cache_manager import get_cached, put_cached, discard, track_dataset, untrack_dataset, estimate_size
+from metrics import measure
+from query_engine import filter_rows
 
 # Carregar configurações do arquivo TOML
 #config = toml.load('secrets.toml')
 config = st.secrets
 
-# Caminho para o arquivo de credenciais da conta de serviço
-CREDENTIALS_FILE = json.loads(config['CREDENTIALS_FILE'])
+# Origem dos arquivos das bases: 'drive' (Google Drive, pastas indicadas no secrets) ou 'local'
+# (diretório com a mesma organização de pastas, para rodar o painel e testes de desempenho sem rede)
+STORAGE_BACKEND = config.get('STORAGE_BACKEND', 'drive')
 
-# ID da pasta do Google Drive onde estão os dados "dataset_despesas_detalhado"
-FOLDER_ID = config['FOLDER_ID']
+# Diretório raiz do backend local: uma pasta por base (ex.: dados/despesas/2024/arquivo.parquet, dados/login/usuarios.csv)
+LOCAL_DATA_DIR = config.get('LOCAL_DATA_DIR', 'dados')
 
-# ID da pasta do Google Drive onde estão os dados "contratos"
-CONTRATOS_FOLDER_ID = config['CONTRATOS_FOLDER_ID']
+# Diretório local onde ficam as cópias dos arquivos baixados do Google Drive
+CACHE_DIR = config.get('CACHE_DIR', '.cache/drive')
 
-# Função para autenticar e construir o serviço Google Drive API
+# Campos pedidos ao Google Drive para cada arquivo (checksum e data de modificação validam a cópia local)
+FILE_FIELDS = "files(id, name, parents, md5Checksum, modifiedTime, size)"
+
+# Quantidade máxima de pastas combinadas em uma única consulta "'a' in parents or 'b' in parents"
+PARENTS_PER_QUERY = 40
+
+# Número máximo de downloads simultâneos no processo (mantém o uso dentro das cotas da API do Drive)
+MAX_DOWNLOAD_WORKERS = int(config.get('MAX_DOWNLOAD_WORKERS', 4))
+
+# Executor de downloads único e permanente: suas threads (e a conexão HTTP persistente de cada uma) são
+# reaproveitadas por todas as cargas, em vez de serem recriadas e descartadas a cada chamada de download_files
+_download_executor = ThreadPoolExecutor(max_workers=max(1, MAX_DOWNLOAD_WORKERS), thread_name_prefix='download')
+
+# Tentativas extras de cada chamada ao Drive em erros transitórios (429 e 5xx), com espera exponencial entre elas
+DRIVE_RETRIES = int(config.get('DRIVE_RETRIES', 5))
+
+# Tempo máximo (em segundos) de espera por uma resposta do Drive
+DRIVE_TIMEOUT = int(config.get('DRIVE_TIMEOUT', 120))
+
+# Tamanho (em MB) de cada parte baixada do Drive: limita a memória usada por download, qualquer que seja o arquivo
+DOWNLOAD_CHUNK_MB = int(config.get('DOWNLOAD_CHUNK_MB', 16))
+
+# Pasta das bases anuais compactadas pelo etl.py: um parquet local por ano, já unido e ordenado por UG, ANO e MES,
+# lido na carga no lugar dos arquivos do Drive (sem download, concatenação nem ordenação no painel)
+COMPACT_DIR = config.get('COMPACT_DIR', '.cache/compactado')
+
+# Ordem física dos arquivos compactados
+SORT_COLUMNS = ['UG', 'ANO', 'MES']
+
+# Pasta das bases já normalizadas em formato Arrow IPC, uma por versão: processos do painel no mesmo host
+# mapeiam o mesmo arquivo em memória e compartilham uma única cópia física pelo cache de páginas do sistema
+SHARED_DIR = config.get('SHARED_DIR', '.cache/compartilhado')
+
+# Permite desligar o compartilhamento entre processos pelo secrets
+SHARE_DATASETS = bool(config.get('SHARE_DATASETS', True))
+
+# Tipos MIME usados nas consultas ao Google Drive
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+FILE_MIME_TYPE = 'application/octet-stream'
+
+# Registro das bases de dados do painel: cada base é declarada uma única vez e servida pelo mesmo pipeline.
+# - folder_key: chave do secrets com o ID da pasta no Google Drive (no backend local, a pasta tem o nome da base)
+# - layout: 'anual' (uma subpasta por ano), 'pasta' (arquivos direto na pasta) ou 'recente' (só o arquivo mais recente)
+# - formato: extensão dos arquivos ('parquet' ou 'csv')
+# - arquivos: nomes dos arquivos quando a base é composta por arquivos distintos (ex.: contratos e aditivos)
+# - colunas: esquema mínimo esperado (validado após a carga)
+# - tipos: tipos canônicos aplicados uma vez na carga (nomes de colunas em maiúsculas, inteiros, valores
+#   monetários VALOR_* em float, datas e percentuais); em bases compostas, um dicionário por arquivo
+# - categorias: colunas de texto repetitivo convertidas em categorias (dicionário Arrow -> pd.Categorical)
+# - cubos: agregados pré-calculados por partição (dimensões fixas + uma classificação), usados pelos gráficos
+# - progresso: exibe a barra de progresso durante a carga
+DATASETS = {
+    'despesas': {
+        'folder_key': 'FOLDER_ID',
+        'layout': 'anual',
+        'formato': 'parquet',
+        'colunas': ['UG', 'ANO', 'MES', 'PODER', 'VALOR_EMPENHADO', 'VALOR_LIQUIDADO', 'VALOR_PAGO'],
+        'tipos': {'inteiros': ['UG', 'ANO', 'MES'], 'monetarios': True},
+        'categorias': [
+            'PODER', 'DESCRICAO_UG', 'DESCRICAO_FUNCAO', 'DESCRICAO_SUB_FUNCAO', 'DESCRICAO_FONTE',
+            'DESCRICAO_NATUREZA', 'DESCRICAO_NATUREZA1', 'DESCRICAO_NATUREZA2', 'DESCRICAO_NATUREZA3',
+            'DESCRICAO_NATUREZA4', 'DESCRICAO_NATUREZA5', 'DESCRICAO_NATUREZA6', 'NOME_FAVORECIDO',
+            'TIPO_LICITACAO'
+        ],
+        'cubos': {
+            'dimensoes': ['UG', 'UO', 'ANO', 'MES', 'PODER'],
+            'medidas': ['VALOR_EMPENHADO', 'VALOR_LIQUIDADO', 'VALOR_PAGO'],
+            'classificacoes': [
+                (), ('DESCRICAO_FUNCAO',), ('DESCRICAO_SUB_FUNCAO',), ('DESCRICAO_FONTE',),
+                ('DESCRICAO_NATUREZA1',), ('DESCRICAO_NATUREZA2',), ('DESCRICAO_NATUREZA3',),
+                ('DESCRICAO_NATUREZA4',), ('DESCRICAO_NATUREZA5',), ('DESCRICAO_NATUREZA6',),
+                ('DESCRICAO_NATUREZA6', 'DESCRICAO_NATUREZA'),
+            ],
+        },
+        'progresso': True,
+        'mensagem_erro': 'Nenhum arquivo .parquet encontrado no Google Drive.',
+    },
+    'dotacao': {
+        'folder_key': 'DOTACAO_FOLDER_ID',
+        'layout': 'anual',
+        'formato': 'parquet',
+        'colunas': ['ANO', 'UG', 'PODER', 'UO', 'FUNCAO', 'VALOR_DOTACAO_INICIAL'],
+        'tipos': {'inteiros': ['UG', 'ANO', 'MES'], 'monetarios': True},
+        'progresso': False,
+        'mensagem_erro': 'Nenhum arquivo .parquet encontrado na pasta de dotação do Google Drive.',
+    },
+    'restos': {
+        'folder_key': 'RESTOS_FOLDER_ID',
+        'layout': 'anual',
+        'formato': 'parquet',
+        'colunas': ['ANO', 'UG', 'MES'],
+        'tipos': {'inteiros': ['UG', 'ANO', 'MES'], 'monetarios': True},
+        'progresso': False,
+        'mensagem_erro': 'Nenhum arquivo .parquet encontrado na pasta de restos a pagar do Google Drive.',
+    },
+    'adiantamentos': {
+        'folder_key': 'ADIANTAMENTOS_FOLDER_ID',
+        'layout': 'anual',
+        'formato': 'parquet',
+        'colunas': ['ANO', 'UG', 'DESCRICAO_UG', 'NUM_MES'],
+        'tipos': {'inteiros': ['UG', 'ANO', 'NUM_MES'], 'monetarios': True},
+        'progresso': True,
+        'mensagem_erro': 'Nenhum arquivo .parquet encontrado na pasta de adiantamentos do Google Drive.',
+    },
+    'contratos': {
+        'folder_key': 'CONTRATOS_FOLDER_ID',
+        'layout': 'pasta',
+        'formato': 'parquet',
+        'arquivos': {
+            'aditivos': 'aditivos_reajustes.parquet',
+            'contratos': 'lista_contratos_siafe.parquet',
+        },
+        'tipos': {
+            'aditivos': {},
+            'contratos': {
+                'inteiros': ['UG', 'CODIGO_CONTRATANTE', 'CODIGO_CONTRATO', 'COD_TIPO_LICITACAO', 'COD_SITUACAO'],
+                'monetarios': True,
+                'percentuais': ['VALOR_PERCENTUAL_TERCEIR'],
+                'datas': {
+                    'DATA_PUBLICACAO': {'format': '%d/%m/%Y'},
+                    'DATA_INICIO_VIGENCIA': {'unit': 'ms'},
+                    'DATA_FIM_VIGENCIA': {'unit': 'ms'},
+                },
+            },
+        },
+        'progresso': True,
+        'mensagem_erro': 'Arquivos "aditivos_reajustes.parquet" ou "lista_contratos_siafe.parquet" não encontrados na pasta "contratos" do Google Drive.',
+    },
+    'folha': {
+        'folder_key': 'FOLHA_FOLDER_ID',
+        'layout': 'recente',
+        'formato': 'parquet',
+        'progresso': True,
+        'mensagem_erro': 'Nenhum arquivo .parquet encontrado na pasta "folha de pagamento" do Google Drive.',
+    },
+    'login': {
+        'folder_key': 'LOGIN_FOLDER_ID',
+        'layout': 'recente',
+        'formato': 'csv',
+        'colunas': ['username', 'password'],
+        'progresso': False,
+        'mensagem_erro': 'Nenhum arquivo de login encontrado na pasta do Google Drive.',
+    },
+}
+
+# Manifestos (listagem completa de arquivos) já obtidos do Drive, por base
+_manifests = {}
+_manifest_lock = threading.Lock()
+
+# Colunas declaradas pelas páginas para cada base (a leitura dos parquet usa a união delas)
+_dataset_columns = {}
+
+# Carregar em segundo plano os anos que ainda não foram pedidos pelo painel
+PREFETCH_PARTITIONS = bool(config.get('PREFETCH_PARTITIONS', True))
+
+# Intervalo (em segundos) entre as verificações de novos arquivos no Drive; 0 desativa a atualização em segundo plano
+REFRESH_INTERVAL = int(config.get('REFRESH_INTERVAL', 900))
+
+# Carregar todas as bases em segundo plano assim que o processo inicia, antes da primeira sessão
+WARMUP_DATASETS = bool(config.get('WARMUP_DATASETS', True))
+
+# Número de bases carregadas em paralelo no aquecimento
+WARMUP_WORKERS = int(config.get('WARMUP_WORKERS', 4))
+
+# Validade (em segundos) das credenciais de login em memória; depois disso, são conferidas no Drive em segundo plano
+LOGIN_TTL = int(config.get('LOGIN_TTL', 60))
+
+
+logger = logging.getLogger(__name__)
+
+# Partições anuais em memória: (base, projeção, ano) -> DataFrame
+_partitions = {}
+_partitions_lock = threading.Lock()
+
+# Cubos de cada partição em memória: (base, projeção, ano) -> {classificação: DataFrame agregado}.
+# Ficam junto com a partição (não são descartados pelo teto de memória), pois refazê-los exige agrupar a partição.
+_cubes = {}
+
+# Um lock de carga por base, para que sessões e a pré-carga não baixem o mesmo ano em paralelo
+_loading_locks = {name: threading.Lock() for name in DATASETS}
+
+# Bases com pré-carga em andamento
+_prefetching = set()
+
+# Relatório de memória da conversão em categorias: (base, ano) -> {coluna: bytes antes/depois}
+_encoding_reports = {}
+
+# Itens derivados guardados no cache_manager (descartáveis sob pressão de memória e refeitos sob demanda):
+# - ('montagem', base, projeção, anos): partições concatenadas (só quando há mais de um ano)
+# - ('montagem_cubo', base, projeção, anos, classificação): cubos concatenados (só quando há mais de um ano)
+
+# Bases não anuais já carregadas: (base, projeção) -> dados (substituídos por inteiro a cada nova versão)
+_loaded = {}
+
+# Thread de atualização em segundo plano (iniciada uma vez por processo)
+_refresher = None
+_refresher_lock = threading.Lock()
+
+# Situação do aquecimento de cada base: 'pendente', 'carregando', 'pronta' ou 'erro' (vazio antes de iniciar)
+_warmup = {}
+_warmup_lock = threading.Lock()
+
+# Credenciais de login em memória: usuário (sem espaços) -> senha, com a versão do arquivo e o horário da conferência
+_credentials = {'usuarios': None, 'versao': None, 'conferido_em': 0.0, 'atualizando': False}
+_credentials_lock = threading.Lock()
+
+# Serviço do Drive único do processo (credenciais lidas e cliente construído uma única vez)
+_drive_service = None
+_drive_lock = threading.Lock()
+
+# Armazenamento por thread da conexão HTTP autenticada (httplib2 não é thread-safe)
+_thread_local = threading.local()
+
+# Função para obter a conexão HTTP autenticada da thread atual; cada thread mantém a sua conexão
+# persistente com o Drive, reaproveitada entre as chamadas e os downloads (e refeita se as credenciais mudarem)
+def get_thread_http(credentials):
+    if getattr(_thread_local, 'credentials', None) is not credentials:
+        _thread_local.http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=DRIVE_TIMEOUT))
+        _thread_local.credentials = credentials
+    return _thread_local.http
+
+# Função para autenticar e construir o serviço Google Drive API, compartilhado por todas as threads.
+# Cada requisição é montada sobre a conexão HTTP da thread que a executa, o que torna o serviço thread-safe.
 def get_drive_service():
-    # Carregar o JSON como um dicionário do .env
-    credentials_info = json.loads(config['CREDENTIALS_FILE'])
-
-    # Usar from_service_account_info para passar o dicionário em vez de um arquivo
-    credentials = service_account.Credentials.from_service_account_info(
-        credentials_info,
-        scopes=['https://www.googleapis.com/auth/drive']
-    )
-
-    return build('drive', 'v3', credentials=credentials)
-
-# ========== Login CSV Data Loader ==========
-# Função para listar arquivos .csv na pasta de login no Google Drive
-def list_login_files(service):
-    LOGIN_FOLDER_ID = config['LOGIN_FOLDER_ID']  # Adicionar o ID da pasta de login no .env
-    login_files = service.files().list(
-        q=f"'{LOGIN_FOLDER_ID}' in parents and name contains '.csv'",
-        fields="files(id, name)",
-        orderBy='createdTime desc'
-    ).execute().get('files', [])
-    if not login_files:
-        st.error('Nenhum arquivo de login encontrado na pasta do Google Drive.')
-        return None
-    return login_files[0]  # Pegar o arquivo mais recente
-# Função para carregar o CSV de login do Google Drive (sem cache)
-def load_login_data():
+    global _drive_service
+    with _drive_lock:
+        if _drive_service is None:
+            # Credenciais lidas só quando o Drive é usado pela primeira vez (o backend local não precisa delas).
+            # Usar from_service_account_info para passar o dicionário em vez de um arquivo
+            credentials = service_account.Credentials.from_service_account_info(
+                json.loads(config['CREDENTIALS_FILE']),
+                scopes=['https://www.googleapis.com/auth/drive']
+            )
+
+            def build_request(http, *args, **kwargs):
+                return HttpRequest(get_thread_http(credentials), *args, **kwargs)
+
+            _drive_service = build(
+                'drive', 'v3', http=get_thread_http(credentials), requestBuilder=build_request, cache_discovery=False
+            )
+        return _drive_service
+
+# Função para listar todos os itens de uma consulta ao Drive, percorrendo todas as páginas de resultado
+def list_all_files(service, query, fields=FILE_FIELDS, order_by=None):
+    files = []
+    page_token = None
+    while True:
+        params = {'q': query, 'fields': f"nextPageToken, {fields}", 'pageSize': 1000}
+        if order_by:
+            params['orderBy'] = order_by
+        if page_token:
+            params['pageToken'] = page_token
+
+        response = service.files().list(**params).execute(num_retries=DRIVE_RETRIES)
+        files.extend(response.get('files', []))
+
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return files
+
+# Função para listar os filhos de várias pastas de uma vez, agrupando as pastas em consultas
+# do tipo "'a' in parents or 'b' in parents" para reduzir o número de chamadas à API
+def list_children(service, parent_ids, condition, fields=FILE_FIELDS):
+    children = []
+    for start in range(0, len(parent_ids), PARENTS_PER_QUERY):
+        batch = parent_ids[start:start + PARENTS_PER_QUERY]
+        parents_query = ' or '.join(f"'{parent_id}' in parents" for parent_id in batch)
+        children.extend(list_all_files(service, f"({parents_query}) and {condition} and trashed = false", fields))
+    return children
+
+# Função para converter o nome da pasta de ano em inteiro (None se não for um ano)
+def parse_year(folder_name):
+    folder_name = str(folder_name).strip()
+    return int(folder_name) if folder_name.isdigit() else None
+
+# Função que lista a árvore de pastas de uma base registrada no backend configurado e monta o manifesto em memória
+def build_manifest(name):
+    with measure('listagem', base=name) as info:
+        manifest = get_storage_backend()['listar'](name)
+        info['linhas'] = len(manifest['files'])
+        info['bytes'] = sum(int(file.get('size') or 0) for file in manifest['files'])
+    return manifest
+
+# Função que percorre as pastas da base no Drive e devolve o manifesto.
+# Layout anual: uma consulta para as pastas de ano e uma consulta agrupada para todos os arquivos.
+def scan_drive_manifest(name):
     service = get_drive_service()
-    
-    login_file = list_login_files(service)
-    if not login_file:
-        return pd.DataFrame()
-    # Baixar o arquivo CSV de login
-    login_content = download_file_from_drive(service, login_file['id'])
-    
-    # Carregar o CSV como DataFrame
-    df_login = pd.read_csv(login_content)
-    
-    return df_login
-# ========== Fim do Login CSV Data Loader ==========
-
-# Função para listar arquivos .parquet na pasta de despesas e diárias no Google Drive
-def list_parquet_files(service):
-    results = service.files().list(
-        q=f"'{FOLDER_ID}' in parents and mimeType='application/vnd.google-apps.folder'",
-        fields="files(id, name)"
-    ).execute()
-    folders = results.get('files', [])
-
-    parquet_files = []
-    for folder in folders:
-        folder_id = folder['id']
-        # Listar os arquivos dentro de cada pasta de ano
-        year_files = service.files().list(
-            q=f"'{folder_id}' in parents and mimeType='application/octet-stream'",
+    spec = DATASETS[name]
+    folder_id = config.get(spec['folder_key'])
+    manifest = {'dataset': name, 'files': [], 'listed_at': time.time(), 'versao': manifest_version([])}
+    if not folder_id:
+        return manifest
+
+    extension = f".{spec['formato']}"
+
+    if spec['layout'] == 'recente':
+        files = list_all_files(
+            service,
+            f"'{folder_id}' in parents and name contains '{extension}' and trashed = false",
+            order_by='createdTime desc'
+        )
+        files = [file for file in files if file['name'].endswith(extension)]
+        manifest['files'] = files[:1]  # Pegar o arquivo mais recente
+        manifest['versao'] = manifest_version(manifest['files'])
+        return manifest
+
+    if spec['layout'] == 'pasta':
+        years_by_folder = {folder_id: None}
+    else:
+        # Layout anual: os arquivos ficam dentro de uma subpasta para cada ano
+        year_folders = list_all_files(
+            service,
+            f"'{folder_id}' in parents and mimeType='{FOLDER_MIME_TYPE}' and trashed = false",
             fields="files(id, name)"
-        ).execute()
-        for file in year_files.get('files', []):
-            if file['name'].endswith('.parquet'):
-                parquet_files.append(file)
+        )
+        years_by_folder = {folder['id']: parse_year(folder['name']) for folder in year_folders}
+
+    files = list_children(service, list(years_by_folder), f"mimeType='{FILE_MIME_TYPE}'")
+    for file in files:
+        if not file['name'].endswith(extension):
+            continue
+        parent_id = next((parent for parent in file.get('parents', []) if parent in years_by_folder), None)
+        file['ano'] = years_by_folder.get(parent_id)
+        manifest['files'].append(file)
+
+    # Ordem estável (por ano e nome) para que a concatenação não dependa da ordem devolvida pela API
+    manifest['files'].sort(key=lambda file: (file['ano'] or 0, file['name']))
+    manifest['versao'] = manifest_version(manifest['files'])
+    return manifest
+
+# Função que percorre a pasta local da base (mesma organização do Drive: uma subpasta por ano no layout anual)
+# e devolve o manifesto. A data de modificação do arquivo faz o papel do modifiedTime do Drive na versão.
+def scan_local_manifest(name):
+    spec = DATASETS[name]
+    folder = os.path.join(LOCAL_DATA_DIR, name)
+    manifest = {'dataset': name, 'files': [], 'listed_at': time.time(), 'versao': manifest_version([])}
+    if not os.path.isdir(folder):
+        return manifest
+
+    extension = f".{spec['formato']}"
+    if spec['layout'] == 'anual':
+        years_by_folder = {entry.path: parse_year(entry.name) for entry in os.scandir(folder) if entry.is_dir()}
+    else:
+        years_by_folder = {folder: None}
+
+    files = []
+    for path, year in years_by_folder.items():
+        for entry in os.scandir(path):
+            if not entry.is_file() or not entry.name.endswith(extension):
+                continue
+            stat = entry.stat()
+            files.append({
+                'id': os.path.relpath(entry.path, LOCAL_DATA_DIR),
+                'name': entry.name,
+                'caminho': entry.path,
+                'modifiedTime': str(stat.st_mtime_ns),
+                'size': str(stat.st_size),
+                'ano': year,
+            })
 
-    return parquet_files
+    if spec['layout'] == 'recente':
+        # Pegar o arquivo mais recente
+        files = sorted(files, key=lambda file: int(file['modifiedTime']), reverse=True)[:1]
+    else:
+        files.sort(key=lambda file: (file['ano'] or 0, file['name']))
+    manifest['files'] = files
+    manifest['versao'] = manifest_version(files)
+    return manifest
 
-# Função para listar arquivos .parquet na pasta de contratos
-def list_contracts_files(service):
-    # Listar os arquivos na pasta "contratos" usando o ID fornecido
-    contract_files = service.files().list(
-        q=f"'{CONTRATOS_FOLDER_ID}' in parents and mimeType='application/octet-stream'",
-        fields="files(id, name)"
-    ).execute().get('files', [])
+# Função para calcular a versão de um conjunto de arquivos (muda quando algum arquivo é incluído, removido ou alterado)
+def manifest_version(files):
+    digest = hashlib.md5()
+    for file in files:
+        digest.update(f"{file['id']}|{file.get('md5Checksum')}|{file.get('modifiedTime')};".encode('utf-8'))
+    return digest.hexdigest()
 
-    if not contract_files:
-        st.error('Nenhum arquivo de contratos encontrado na pasta "contratos" do Google Drive.')
-        return []
+# Função para obter o manifesto de uma base, reaproveitando o que já foi listado neste processo
+def get_manifest(name, refresh=False):
+    with _manifest_lock:
+        manifest = _manifests.get(name)
+    if manifest is not None and not refresh:
+        return manifest
 
-    return contract_files
+    manifest = build_manifest(name)
+    with _manifest_lock:
+        _manifests[name] = manifest
+    return manifest
 
-# Função para baixar arquivos do Google Drive
-def download_file_from_drive(service, file_id):
+# Função para listar os arquivos de uma base registrada a partir do manifesto
+def list_dataset_files(name, refresh=False):
+    return get_manifest(name, refresh)['files']
+
+# Função para baixar um arquivo do Google Drive em partes, gravando cada parte direto no destino informado
+# (arquivo aberto em disco ou BytesIO). Retorna a quantidade de bytes baixados.
+def download_file_from_drive(service, file_id, target):
     request = service.files().get_media(fileId=file_id)
-    response = request.execute()
-    return BytesIO(response)
+    downloader = MediaIoBaseDownload(target, request, chunksize=DOWNLOAD_CHUNK_MB * 1024 * 1024)
+    done = False
+    while not done:
+        _, done = downloader.next_chunk(num_retries=DRIVE_RETRIES)
+    return target.tell()
+
+# Função para montar os caminhos da cópia local (conteúdo e metadados) de um arquivo do Drive
+def get_cache_paths(file_id):
+    return os.path.join(CACHE_DIR, file_id), os.path.join(CACHE_DIR, f"{file_id}.json")
+
+# Função para verificar se a cópia local ainda corresponde à versão do arquivo no Drive
+def is_cache_valid(file, data_path, meta_path):
+    if not os.path.exists(data_path) or not os.path.exists(meta_path):
+        return False
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            cached_meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if file.get('md5Checksum') and cached_meta.get('md5Checksum') != file['md5Checksum']:
+        return False
+    return cached_meta.get('modifiedTime') == file.get('modifiedTime')
+
+# Função para obter um arquivo do Drive, lendo do disco quando a cópia local ainda é válida
+def get_cached_file(file, name=None):
+    data_path, meta_path = get_cache_paths(file['id'])
+    if is_cache_valid(file, data_path, meta_path):
+        return data_path
 
-# Função para carregar arquivos de despesas e diárias, com cache
-@st.cache_resource
-def load_parquet_data_from_drive():
     service = get_drive_service()
-    parquet_files = list_parquet_files(service)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    # Baixar para um arquivo temporário e renomear, para nunca deixar uma cópia pela metade
+    tmp_path = f"{data_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with measure('download', base=name, ano=file.get('ano'), arquivo=file['name']) as info:
+        try:
+            with open(tmp_path, 'wb') as f:
+                info['bytes'] = download_file_from_drive(service, file['id'], f)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, data_path)
+
+    cached_meta = {key: file.get(key) for key in ('id', 'name', 'md5Checksum', 'modifiedTime', 'size')}
+    tmp_meta_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_meta_path, 'w', encoding='utf-8') as f:
+        json.dump(cached_meta, f)
+    os.replace(tmp_meta_path, meta_path)
+
+    return data_path
+
+# Função para baixar um arquivo do Drive apenas para a memória, sem cópia em disco.
+# Usada para arquivos CSV, como o de login, cujas senhas não podem ficar gravadas no servidor.
+def get_drive_file_in_memory(file, name=None):
+    # Remover cópias em disco deixadas por versões anteriores do painel
+    for path in get_cache_paths(file['id']):
+        if os.path.exists(path):
+            os.remove(path)
+
+    content = BytesIO()
+    with measure('download', base=name, ano=file.get('ano'), arquivo=file['name']) as info:
+        info['bytes'] = download_file_from_drive(get_drive_service(), file['id'], content)
+    content.seek(0)
+    return content
+
+# Função para obter um arquivo do backend local (lido direto da pasta, sem cópia)
+def get_local_file(file, name=None):
+    return file['caminho']
+
+# Backends de armazenamento:
+# - 'listar' monta o manifesto de uma base
+# - 'obter' devolve o caminho local de um arquivo (no Drive, a cópia em disco)
+# - 'obter_em_memoria' devolve o conteúdo sem gravá-lo em disco (arquivos CSV)
+STORAGE_BACKENDS = {
+    'drive': {'listar': scan_drive_manifest, 'obter': get_cached_file, 'obter_em_memoria': get_drive_file_in_memory},
+    'local': {'listar': scan_local_manifest, 'obter': get_local_file, 'obter_em_memoria': get_local_file},
+}
+
+# Função para obter o backend de armazenamento configurado no secrets (STORAGE_BACKEND)
+def get_storage_backend():
+    if STORAGE_BACKEND not in STORAGE_BACKENDS:
+        raise ValueError(f'Backend de armazenamento desconhecido: "{STORAGE_BACKEND}".')
+    return STORAGE_BACKENDS[STORAGE_BACKEND]
+
+# Função usada pelas páginas (na importação) para declarar as colunas que consomem de uma base.
+# A carga lê apenas a união das colunas declaradas por todas as páginas, mais o esquema mínimo do registro.
+def register_columns(name, columns):
+    _dataset_columns.setdefault(name, set()).update(columns)
+
+# Função para obter a projeção de colunas de uma base: união das colunas declaradas pelas
+# páginas e do esquema mínimo do registro (None quando nenhuma página declarou colunas)
+def get_projection(name):
+    columns = _dataset_columns.get(name)
+    if not columns:
+        return None
+    return tuple(sorted(columns | set(DATASETS[name].get('colunas', []))))
+
+# Função para ler um arquivo parquet decodificando apenas as colunas da projeção.
+# O arquivo é mapeado em memória: a decodificação lê as páginas direto do disco, sem copiar o arquivo inteiro antes.
+def read_parquet_columns(path, columns=None):
+    if columns is None:
+        return pq.read_table(path, memory_map=True)
+
+    # Casar os nomes sem diferenciar maiúsculas/minúsculas e ignorar colunas ausentes no arquivo
+    file_columns = {name.strip().upper(): name for name in pq.read_schema(path, memory_map=True).names}
+    selected = [file_columns[col.upper()] for col in columns if col.upper() in file_columns]
+    return pq.read_table(path, columns=selected, memory_map=True)
+
+# Função executada por cada worker: obtém o arquivo do backend (baixando-o, se preciso) e o decodifica.
+# Parquet é devolvido como tabela Arrow (a conversão para pandas acontece uma única vez, após a concatenação).
+# CSV (login) é lido da memória, sem passar pela cópia em disco.
+def fetch_file(file, formato='parquet', columns=None, name=None):
+    if formato == 'csv':
+        source = get_storage_backend()['obter_em_memoria'](file, name)
+        with measure('leitura', base=name, ano=file.get('ano'), arquivo=file['name']) as info:
+            data = pd.read_csv(source)
+            info['linhas'] = len(data)
+        return data
+
+    path = get_storage_backend()['obter'](file, name)
+    with measure('leitura', base=name, ano=file.get('ano'), arquivo=file['name']) as info:
+        info['bytes'] = os.path.getsize(path)
+        data = read_parquet_columns(path, columns)
+        info['linhas'] = data.num_rows
+    return data
+
+# Função para converter colunas de texto em dicionário (códigos inteiros + valores distintos),
+# registrando a memória ocupada por coluna antes e depois da conversão
+def encode_categories(name, table, year=None):
+    columns = {col.upper() for col in DATASETS[name].get('categorias', [])}
+    if not columns:
+        return table
+
+    report = {}
+    for idx, field in enumerate(table.schema):
+        if field.name.strip().upper() not in columns:
+            continue
+        if not (pa.types.is_string(field.type) or pa.types.is_large_string(field.type)):
+            continue
+
+        column = table.column(idx)
+        encoded = column.dictionary_encode()
+        table = table.set_column(idx, field.name, encoded)
+        report[field.name] = {'bytes_antes': column.nbytes, 'bytes_depois': encoded.nbytes}
+
+    # Substitui o relatório anterior da mesma partição (recargas não acumulam valores)
+    _encoding_reports[(name, year)] = report
+
+    # Arquivos diferentes geram dicionários diferentes: unificar para que cada coluna vire um único pd.Categorical
+    return table.unify_dictionaries()
+
+# Função para obter o relatório de memória por coluna da conversão em categorias de uma base
+def get_encoding_report(name):
+    totals = {}
+    for (report_name, _), report in list(_encoding_reports.items()):
+        if report_name != name:
+            continue
+        for column, sizes in report.items():
+            total = totals.setdefault(column, {'bytes_antes': 0, 'bytes_depois': 0})
+            total['bytes_antes'] += sizes['bytes_antes']
+            total['bytes_depois'] += sizes['bytes_depois']
+
+    report = pd.DataFrame.from_dict(totals, orient='index')
+    if report.empty:
+        return report
+    report['reducao_%'] = (1 - report['bytes_depois'] / report['bytes_antes']) * 100
+    return report.rename_axis('coluna').reset_index()
 
-    if not parquet_files:
-        st.error('Nenhum arquivo .parquet encontrado no Google Drive.')
+# Função para concatenar tabelas Arrow (unificando os esquemas) e convertê-las para pandas uma única vez.
+# A lista recebida é esvaziada para que a memória Arrow possa ser liberada durante a conversão.
+def tables_to_pandas(tables, name=None, year=None):
+    if not tables:
         return pd.DataFrame()
+    if len(tables) == 1:
+        table = tables[0]
+    else:
+        with measure('concatenacao', base=name, ano=year) as info:
+            # Arquivos de anos diferentes podem ter tipos levemente diferentes (ex.: int32 x int64, colunas nulas)
+            table = pa.concat_tables(tables, promote_options='permissive')
+            info['partes'] = len(tables)
+            info['linhas'] = table.num_rows
+            info['bytes'] = table.nbytes
+    tables.clear()
+
+    with measure('conversao', base=name, ano=year) as info:
+        if name is not None:
+            table = encode_categories(name, table, year)
+        info['linhas'] = table.num_rows
+        info['bytes'] = table.nbytes
+
+        # split_blocks evita a consolidação em blocos; self_destruct libera cada coluna Arrow ao convertê-la
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+
+# Função para converter uma coluna em inteiro (Int64 com suporte a nulos quando houver valores inválidos)
+def to_integer(series):
+    if pd.api.types.is_integer_dtype(series):
+        return series
+    numbers = pd.to_numeric(series, errors='coerce')
+    return numbers.astype('int64') if numbers.notna().all() else numbers.astype('Int64')
+
+# Estágio de normalização: aplica os tipos canônicos uma única vez, logo após a carga,
+# para que as páginas não precisem repetir conversões a cada interação
+def normalize_frame(df, tipos):
+    df.columns = df.columns.str.strip().str.upper()
+
+    inteiros = set(tipos.get('inteiros', []))
+    percentuais = set(tipos.get('percentuais', []))
+    datas = tipos.get('datas', {})
+
+    for col in df.columns:
+        if col in inteiros:
+            df[col] = to_integer(df[col])
+        elif col in percentuais:
+            # Texto (object ou o tipo str do pandas 3) com o símbolo de percentual
+            if not pd.api.types.is_numeric_dtype(df[col]):
+                df[col] = pd.to_numeric(df[col].str.replace('%', ''), errors='coerce') / 100
+        elif col in datas:
+            if not pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = pd.to_datetime(df[col], errors='coerce', **datas[col])
+        elif tipos.get('monetarios') and col.startswith('VALOR_'):
+            if not pd.api.types.is_float_dtype(df[col]):
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+
+    return df
+
+# Função que aplica normalize_frame registrando a etapa 'normalizacao' nas medições da carga
+def normalize_measured(name, df, tipos, year=None, arquivo=None):
+    with measure('normalizacao', base=name, ano=year, arquivo=arquivo) as info:
+        info['linhas'] = len(df)
+        return normalize_frame(df, tipos)
+
+# Função para ordenar uma partição por UG uma única vez na carga, para que cada UG ocupe um intervalo
+# contíguo de linhas (índice de UG do query_engine). Arquivos já compactados pelo etl.py chegam ordenados.
+def sort_by_ug(df):
+    if 'UG' not in df.columns or df['UG'].is_monotonic_increasing:
+        return df
+    return df.sort_values('UG', kind='stable', na_position='last', ignore_index=True)
+
+# Função para obter o carimbo ordenável de um conjunto de arquivos: os dígitos da maior data de modificação
+# (ISO do Drive ou nanossegundos do backend local), usado para saber qual versão compartilhada é mais recente
+def shared_stamp(files):
+    stamps = [re.sub(r'\D', '', str(file.get('modifiedTime') or '')) for file in files]
+    return max((int(stamp) for stamp in stamps if stamp), default=0)
+
+# Função para montar o caminho do arquivo Arrow compartilhado de uma base (ou de um ano), na versão dos arquivos
+# informados e na projeção de colunas pedida: "<rótulo>-<projeção>-<carimbo>-<versão>.arrow"
+def get_shared_path(name, label, files, columns=None):
+    projection = hashlib.md5(repr(columns).encode('utf-8')).hexdigest()[:8]
+    file_name = f"{label}-{projection}-{shared_stamp(files)}-{manifest_version(files)}.arrow"
+    return os.path.join(SHARED_DIR, name, file_name)
+
+# Função para abrir um arquivo Arrow compartilhado por mapeamento em memória (None quando ele não existe).
+# Colunas numéricas sem nulos apontam direto para as páginas do arquivo, sem cópia para a memória do processo.
+def read_shared_frame(path):
+    if not SHARE_DATASETS or not os.path.exists(path):
+        return None
+    with measure('mapeamento', arquivo=os.path.basename(path)) as info:
+        try:
+            table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        except (OSError, pa.ArrowInvalid):
+            logger.warning('Arquivo compartilhado inválido ignorado: %s', path)
+            return None
+        info['bytes'] = table.nbytes
+        info['linhas'] = table.num_rows
+        return table.to_pandas(split_blocks=True)
+
+# Função para gravar uma base normalizada como arquivo Arrow IPC sem compressão (requisito para o mapeamento
+# sem cópia) e remover as versões mais antigas (carimbo menor) do mesmo arquivo. Versões mais novas, gravadas
+# por réplicas que já enxergam arquivos atualizados, são mantidas. Processos que ainda mapeiam uma versão
+# removida continuam lendo-a normalmente até descartá-la.
+def write_shared_frame(path, frame):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+
+    # Gravar em arquivo temporário e renomear, para que outro processo nunca mapeie um arquivo pela metade
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+    prefix, stamp, _ = os.path.basename(path)[:-len('.arrow')].rsplit('-', 2)
+    for file_name in os.listdir(directory):
+        if not file_name.endswith('.arrow'):
+            continue
+        parts = file_name[:-len('.arrow')].rsplit('-', 2)
+        if len(parts) != 3 or parts[0] != prefix or not parts[1].isdigit() or int(parts[1]) >= int(stamp):
+            continue
+        try:
+            os.remove(os.path.join(directory, file_name))
+        except OSError:
+            pass
+
+# Função que grava a base (ou o ano) recém-montada no arquivo compartilhado e passa a usar a cópia mapeada,
+# como os demais processos. Se a gravação falhar, o DataFrame montado continua sendo usado.
+def share_frame(path, frame):
+    if frame is None or not SHARE_DATASETS:
+        return frame
+    try:
+        write_shared_frame(path, frame)
+    except (OSError, pa.ArrowException):
+        logger.exception('Falha ao gravar o arquivo compartilhado %s', path)
+        return frame
+    shared = read_shared_frame(path)
+    return frame if shared is None else shared
+
+# Função para montar o cubo de uma classificação em uma partição: somas das medidas (e quantidade de linhas)
+# agrupadas pelas dimensões fixas e pela classificação. Retorna None se a classificação está fora da projeção.
+def build_cube(name, df, classification):
+    spec = DATASETS[name].get('cubos')
+    if not spec or not set(classification) <= set(df.columns):
+        return None
+
+    dimensions = [col for col in spec['dimensoes'] if col in df.columns]
+    measures = [col for col in spec['medidas'] if col in df.columns]
+    # dropna=False mantém linhas com dimensões nulas, para que os filtros de nulos continuem valendo no cubo
+    grouped = df.groupby(dimensions + list(classification), observed=True, dropna=False, sort=False)
+    cube = grouped[measures].sum()
+    cube['QUANTIDADE'] = grouped.size()
+    return cube.reset_index()
+
+# Função para montar os cubos de todas as classificações declaradas de uma partição
+def build_cubes(name, df):
+    spec = DATASETS[name].get('cubos')
+    if not spec:
+        return {}
+    cubes = {classification: build_cube(name, df, classification) for classification in spec['classificacoes']}
+    return {classification: cube for classification, cube in cubes.items() if cube is not None}
+
+# Função para contabilizar no cache_manager uma partição carregada e seus cubos
+def track_partition(name, columns, year, frame, cubes):
+    track_dataset(('particao', name, columns, year), frame)
+    track_dataset(('cubos', name, columns, year), cubes)
+
+# Função para deixar de contabilizar uma partição descartada e seus cubos
+def untrack_partition(name, columns, year):
+    untrack_dataset(('particao', name, columns, year))
+    untrack_dataset(('cubos', name, columns, year))
+
+# Função para guardar uma partição carregada e seus cubos
+def store_partition(name, columns, year, frame, cubes):
+    with _partitions_lock:
+        _partitions[(name, columns, year)] = frame
+        _cubes[(name, columns, year)] = cubes
+    track_partition(name, columns, year, frame, cubes)
+
+# Função para concatenar DataFrames preservando as colunas categóricas
+# (pd.concat converteria para texto as categorias com valores distintos entre partições)
+def concat_frames(frames, name=None):
+    if len(frames) == 1:
+        return frames[0]
+
+    with measure('concatenacao', base=name) as info:
+        info['partes'] = len(frames)
+        if any(list(frame.columns) != list(frames[0].columns) for frame in frames):
+            data = pd.concat(frames, ignore_index=True)
+        else:
+            columns = {}
+            for col in frames[0].columns:
+                if all(isinstance(frame[col].dtype, pd.CategoricalDtype) for frame in frames):
+                    columns[col] = pd.Series(union_categoricals([frame[col] for frame in frames], ignore_order=True))
+                else:
+                    columns[col] = pd.concat([frame[col] for frame in frames], ignore_index=True)
+            data = pd.DataFrame(columns)
+        info['linhas'] = len(data)
+        info['bytes'] = estimate_size(data)
+        return data
+
+# Função para baixar e decodificar vários arquivos em paralelo (no executor de downloads do processo),
+# preservando a ordem original
+def download_files(files, formato='parquet', progress_bar=None, columns=None, name=None):
+    data_frames = [None] * len(files)
+    futures = {
+        _download_executor.submit(fetch_file, file, formato, columns, name): idx for idx, file in enumerate(files)
+    }
 
-    # Carregar todos os arquivos .parquet e concatenar
-    data_frames = []
-    total_files = len(parquet_files)
+    try:
+        # A barra de progresso só pode ser atualizada pela thread do Streamlit
+        for done, future in enumerate(as_completed(futures), start=1):
+            data_frames[futures[future]] = future.result()
+            if progress_bar is not None:
+                progress_bar.progress(done / len(files))
+    except BaseException:
+        # Em caso de falha, não deixar os downloads restantes ocupando o executor compartilhado
+        for future in futures:
+            future.cancel()
+        raise
 
-    # Inicializar a barra de progresso
-    progress_bar = st.progress(0)
-    for idx, file in enumerate(parquet_files):
-        file_content = download_file_from_drive(service, file['id'])
-        data_frames.append(pq.read_table(file_content).to_pandas())
+    return data_frames
 
-        # Atualizar a barra de progresso
-        progress_percentage = (idx + 1) / total_files
-        progress_bar.progress(progress_percentage)
+# Função para verificar se o DataFrame carregado contém as colunas declaradas no registro
+def missing_columns(name, df):
+    expected = {col.upper() for col in DATASETS[name].get('colunas', [])}
+    return sorted(expected - {str(col).strip().upper() for col in df.columns})
 
-    return pd.concat(data_frames, ignore_index=True)
+# Pipeline comum de carga de uma base registrada: listar, baixar, decodificar e concatenar.
+# Retorna None quando a base não pode ser carregada (pasta vazia ou arquivos ausentes).
+def load_dataset(name, progress_bar=None, refresh=False, columns=None):
+    return build_dataset(name, list_dataset_files(name, refresh), progress_bar, columns)
 
-# Função principal para carregar os dados de despesas e diárias
-def load_data():
+# Função para baixar, decodificar e concatenar os arquivos informados de uma base
+def build_dataset(name, files, progress_bar=None, columns=None):
+    spec = DATASETS[name]
+
+    if not files:
+        return None
+
+    # Bases compostas (ex.: contratos) retornam um DataFrame para cada arquivo declarado
+    if 'arquivos' in spec:
+        files_by_name = {file['name']: file for file in files}
+        selected_files = [files_by_name.get(file_name) for file_name in spec['arquivos'].values()]
+        if any(file is None for file in selected_files):
+            return None
+
+        # Cada arquivo é compartilhado entre processos com o seu próprio rótulo (ex.: contratos, aditivos)
+        shared_paths = {key: get_shared_path(name, key, [file]) for key, file in zip(spec['arquivos'], selected_files)}
+        data = {key: read_shared_frame(path) for key, path in shared_paths.items()}
+        missing = [(key, file) for key, file in zip(spec['arquivos'], selected_files) if data[key] is None]
+        if missing:
+            tables = download_files([file for _, file in missing], spec['formato'], progress_bar, name=name)
+            for (key, _), table in zip(missing, tables):
+                frame = tables_to_pandas([table])
+                if 'tipos' in spec:
+                    frame = normalize_measured(name, frame, spec['tipos'].get(key, {}), arquivo=key)
+                data[key] = share_frame(shared_paths[key], frame)
+        return data
+
+    # CSV (login) não é compartilhado entre processos: as senhas nunca são gravadas em disco
+    if spec['formato'] == 'csv':
+        return pd.concat(download_files(files, spec['formato'], progress_bar, name=name), ignore_index=True)
+
+    shared_path = get_shared_path(name, 'base', files, columns)
+    data = read_shared_frame(shared_path)
+    if data is not None:
+        return data
+
+    data = tables_to_pandas(download_files(files, spec['formato'], progress_bar, columns, name), name)
+    if 'tipos' in spec:
+        data = normalize_measured(name, data, spec['tipos'])
+    return share_frame(shared_path, data)
+
+# Função para listar os anos disponíveis de uma base com layout anual (a partir do manifesto)
+def list_dataset_years(name):
+    return sorted({file['ano'] for file in get_manifest(name)['files'] if file.get('ano') is not None})
+
+# Função para selecionar os arquivos do manifesto que pertencem aos anos pedidos.
+# Arquivos fora de uma pasta de ano (ano None) são sempre incluídos.
+def select_partition_files(name, years=None):
+    files = get_manifest(name)['files']
+    if years is None:
+        return files
+    years = set(years)
+    return [file for file in files if file.get('ano') is None or file['ano'] in years]
+
+# Função para listar os anos pedidos que ainda não estão em memória
+def missing_partitions(name, years=None):
+    columns = get_projection(name)
+    wanted = {file.get('ano') for file in select_partition_files(name, years)}
+    with _partitions_lock:
+        return sorted((year for year in wanted if (name, columns, year) not in _partitions), key=lambda year: year or 0)
+
+# Função que garante em memória as partições anuais pedidas, baixando primeiro o ano mais recente
+def ensure_partitions(name, years=None, progress_bar=None):
+    columns = get_projection(name)
+
+    with _loading_locks[name]:
+        # Conferir de novo após obter o lock: outra sessão pode ter carregado os anos enquanto esperávamos
+        missing_years = set(missing_partitions(name, years))
+        if not missing_years:
+            return
+
+        files = [file for file in select_partition_files(name, years) if file.get('ano') in missing_years]
+        with measure('base', base=name) as info:
+            info['linhas'] = 0
+            for year, frame, cubes in build_partitions(name, files, columns, progress_bar):
+                store_partition(name, columns, year, frame, cubes)
+                info['linhas'] += len(frame)
+            info['anos'] = sorted(missing_years, key=lambda year: year or 0)
+
+# Função que baixa os arquivos informados e gera um DataFrame (e seus cubos) por ano, do mais recente ao mais antigo.
+# Anos já gravados por outro processo (arquivo Arrow compartilhado) são mapeados em memória; anos já compactados
+# pelo etl.py (na mesma versão do manifesto) são lidos do arquivo local ordenado.
+def build_partitions(name, files, columns=None, progress_bar=None):
+    spec = DATASETS[name]
+    files_by_year = {}
+    for file in sorted(files, key=lambda file: file.get('ano') or 0, reverse=True):
+        files_by_year.setdefault(file.get('ano'), []).append(file)
+
+    shared_paths = {
+        year: get_shared_path(name, year if year is not None else 'sem_ano', year_files, columns)
+        for year, year_files in files_by_year.items()
+    }
+    shared = {year: read_shared_frame(path) for year, path in shared_paths.items()}
+    compacted = {
+        year: get_compacted_file(name, year, year_files) if shared[year] is None else None
+        for year, year_files in files_by_year.items()
+    }
+    to_download = [file for file in files if shared[file.get('ano')] is None and compacted[file.get('ano')] is None]
+    to_download.sort(key=lambda file: file.get('ano') or 0, reverse=True)
+    tables = download_files(to_download, spec['formato'], progress_bar, columns, name)
+
+    tables_by_year = {}
+    for file, table in zip(to_download, tables):
+        tables_by_year.setdefault(file.get('ano'), []).append(table)
+    del tables
+
+    # Cada ano é concatenado em Arrow e convertido para pandas uma única vez
+    for year in files_by_year:
+        frame = shared.pop(year)
+        if frame is None:
+            if compacted[year] is not None:
+                with measure('leitura', base=name, ano=year, arquivo=os.path.basename(compacted[year])) as info:
+                    info['bytes'] = os.path.getsize(compacted[year])
+                    year_tables = [read_parquet_columns(compacted[year], columns)]
+                    info['linhas'] = year_tables[0].num_rows
+            else:
+                year_tables = tables_by_year.pop(year)
+            frame = tables_to_pandas(year_tables, name, year)
+            if 'tipos' in spec:
+                frame = normalize_measured(name, frame, spec['tipos'], year)
+            frame = share_frame(shared_paths[year], sort_by_ug(frame))
+        with measure('cubos', base=name, ano=year) as info:
+            cubes = build_cubes(name, frame)
+            info['linhas'] = sum(len(cube) for cube in cubes.values())
+        yield year, frame, cubes
+
+# Função para montar os caminhos do arquivo compactado (e de seus metadados) de um ano de uma base
+def get_compact_paths(name, year):
+    base = os.path.join(COMPACT_DIR, name, str(year) if year is not None else 'sem_ano')
+    return f"{base}.parquet", f"{base}.json"
+
+# Função que devolve o arquivo compactado de um ano quando ele corresponde à versão atual dos arquivos do Drive
+def get_compacted_file(name, year, files):
+    data_path, meta_path = get_compact_paths(name, year)
+    if not os.path.exists(data_path) or not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data_path if meta.get('versao') == manifest_version(files) else None
+
+# Função para localizar no esquema Arrow o nome real de uma coluna (sem diferenciar maiúsculas/minúsculas)
+def find_column(schema, column):
+    return next((name for name in schema.names if name.strip().upper() == column.upper()), None)
+
+# Função que compacta um ano: concatena os arquivos do Drive, ordena por UG, ANO e MES e grava um único parquet.
+# O arquivo é sempre lido por inteiro (a partição do ano alimenta também os cubos de todas as UGs), então não há
+# leitura parcial por UG a partir das estatísticas dos row groups.
+def compact_partition(name, year, files):
+    spec = DATASETS[name]
+    tables = download_files(files, spec['formato'], name=name)
+    table = tables[0] if len(tables) == 1 else pa.concat_tables(tables, promote_options='permissive')
+    del tables
+
+    sort_keys = [(find_column(table.schema, col), 'ascending') for col in SORT_COLUMNS]
+    table = table.sort_by([key for key in sort_keys if key[0] is not None])
+
+    data_path, meta_path = get_compact_paths(name, year)
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+
+    # Gravar em arquivo temporário e renomear, para que o painel nunca leia um arquivo pela metade
+    tmp_path = f"{data_path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, data_path)
+
+    meta = {
+        'versao': manifest_version(files),
+        'linhas': table.num_rows,
+        'compactado_em': time.time(),
+    }
+    tmp_meta_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp_meta_path, meta_path)
+    return meta
+
+# Função que compacta os anos pedidos de uma base anual (apenas os desatualizados, a menos que force=True).
+# Retorna {ano: metadados} dos anos compactados nesta execução.
+def compact_dataset(name, years=None, force=False):
+    if DATASETS[name]['layout'] != 'anual':
+        raise ValueError(f'A base "{name}" não tem layout anual.')
+
+    manifest = get_manifest(name, refresh=True)
+    files_by_year = {}
+    for file in manifest['files']:
+        if years is None or file.get('ano') in years:
+            files_by_year.setdefault(file.get('ano'), []).append(file)
+
+    compacted = {}
+    for year, files in sorted(files_by_year.items(), key=lambda item: item[0] or 0, reverse=True):
+        if not force and get_compacted_file(name, year, files) is not None:
+            continue
+        compacted[year] = compact_partition(name, year, files)
+    return compacted
+
+# Função para obter o tipo canônico de uma coluna (o mesmo que normalize_frame aplica) em um DataFrame vazio
+def empty_dtype(name, col):
+    tipos = DATASETS[name].get('tipos', {})
+    if col in tipos.get('inteiros', []):
+        return 'int64'
+    if col in tipos.get('datas', {}):
+        return 'datetime64[ns]'
+    if col in tipos.get('percentuais', []) or (tipos.get('monetarios') and col.startswith('VALOR_')):
+        return 'float64'
+    return 'object'
+
+# Função para montar um DataFrame vazio com as colunas informadas (por padrão, a projeção da base ou o esquema
+# mínimo do registro), para que as páginas possam filtrar e agregar mesmo quando nenhum ano pedido foi carregado
+def empty_frame(name, columns=None):
+    if columns is None:
+        columns = get_projection(name) or DATASETS[name].get('colunas', [])
+    columns = [col.upper() for col in columns]
+    return pd.DataFrame({col: pd.Series(dtype=empty_dtype(name, col)) for col in columns})
+
+# Função para montar um cubo vazio de uma classificação, com as mesmas colunas de build_cube
+def empty_cube(name, classification=()):
+    spec = DATASETS[name]['cubos']
+    projection = get_projection(name)
+    available = lambda col: projection is None or col in projection
+    columns = [col for col in spec['dimensoes'] + list(classification) + spec['medidas'] if available(col)]
+    frame = empty_frame(name, columns)
+    frame['QUANTIDADE'] = pd.Series(dtype='int64')
+    return frame
+
+# Função para montar um DataFrame com as partições dos anos pedidos (reaproveitando montagens recentes)
+def assemble_partitions(name, years=None):
+    columns = get_projection(name)
+    wanted = sorted({file.get('ano') for file in select_partition_files(name, years)}, key=lambda year: year or 0)
+
+    with _partitions_lock:
+        present = [year for year in wanted if (name, columns, year) in _partitions]
+        frames = [_partitions[(name, columns, year)] for year in present]
+
+    if not frames:
+        return empty_frame(name, columns)
+    # Um único ano é a própria partição (já contabilizada): não guardar uma segunda referência no cache
+    if len(frames) == 1:
+        return frames[0]
+
+    # A chave usa os anos efetivamente carregados, para não reaproveitar uma montagem feita antes de um ano chegar
+    assembled_key = ('montagem', name, columns, tuple(present))
+    data = get_cached(assembled_key)
+    if data is not None:
+        return data
+    return put_cached(assembled_key, concat_frames(frames, name))
+
+# Função para montar um DataFrame só com as linhas dos anos pedidos que atendem aos filtros (mesmo formato de
+# filter_rows): cada partição é filtrada pelo seu índice de UG e apenas as fatias filtradas são concatenadas,
+# sem montar a cópia completa dos anos selecionados
+def filter_partitions(name, years=None, filters=None, ranges=None, not_null=None):
+    columns = get_projection(name)
+    wanted = sorted({file.get('ano') for file in select_partition_files(name, years)}, key=lambda year: year or 0)
+
+    with _partitions_lock:
+        frames = [_partitions[(name, columns, year)] for year in wanted if (name, columns, year) in _partitions]
+
+    if not frames:
+        return empty_frame(name, columns)
+    return concat_frames([filter_rows(frame, filters, ranges, not_null) for frame in frames], name)
+
+# Função para montar o cubo de uma classificação com as partições dos anos pedidos (já carregadas)
+def assemble_cube(name, classification=(), years=None):
+    classification = (classification,) if isinstance(classification, str) else tuple(classification)
+    columns = get_projection(name)
+    wanted = sorted({file.get('ano') for file in select_partition_files(name, years)}, key=lambda year: year or 0)
+
+    with _partitions_lock:
+        present = [
+            year for year in wanted
+            if classification in _cubes.get((name, columns, year), {})
+        ]
+        cubes = [_cubes[(name, columns, year)][classification] for year in present]
+
+    if not cubes:
+        return empty_cube(name, classification)
+    # Um único ano é o próprio cubo da partição (já contabilizado): não guardar uma segunda referência no cache
+    if len(cubes) == 1:
+        return cubes[0]
+
+    assembled_key = ('montagem_cubo', name, columns, tuple(present), classification)
+    data = get_cached(assembled_key)
+    if data is not None:
+        return data
+    return put_cached(assembled_key, concat_frames(cubes, name))
+
+# Função para carregar em segundo plano, do mais recente ao mais antigo, os anos ainda não carregados.
+# As páginas a chamam depois de obter os anos selecionados, para que ampliar o filtro de ano seja rápido.
+def prefetch_partitions(name):
+    if not PREFETCH_PARTITIONS:
+        return
+    with _partitions_lock:
+        if name in _prefetching:
+            return
+        _prefetching.add(name)
+
+    def run():
+        try:
+            # Um ano por vez, para que uma sessão nunca espere pela pré-carga de vários anos
+            for year in sorted(list_dataset_years(name), reverse=True):
+                ensure_partitions(name, [year])
+        except Exception:
+            logger.exception('Falha na pré-carga da base "%s"', name)
+        finally:
+            with _partitions_lock:
+                _prefetching.discard(name)
+
+    threading.Thread(target=run, name=f'prefetch-{name}', daemon=True).start()
+
+# Função para calcular a versão de cada partição (ano) de uma lista de arquivos
+def partition_versions(files):
+    files_by_year = {}
+    for file in files:
+        files_by_year.setdefault(file.get('ano'), []).append(file)
+    return {year: manifest_version(year_files) for year, year_files in files_by_year.items()}
+
+# Função para listar os anos com arquivos incluídos, alterados ou removidos entre dois manifestos
+def changed_partitions(current_files, new_files):
+    current_versions = partition_versions(current_files)
+    new_versions = partition_versions(new_files)
+    return {
+        year for year in set(current_versions) | set(new_versions)
+        if current_versions.get(year) != new_versions.get(year)
+    }
+
+# Função que verifica se há uma nova versão da base no Drive e, havendo, monta a nova versão
+# fora do caminho das requisições. A troca é atômica: as sessões continuam usando a versão
+# anterior até que a nova esteja completa, e nunca veem uma base pela metade.
+# Em bases anuais, apenas os anos com arquivos incluídos, alterados ou removidos são refeitos.
+def refresh_dataset(name):
+    current = get_manifest(name)
+    manifest = build_manifest(name)
+    if manifest['versao'] == current['versao']:
+        return False
+
+    changed_years = changed_partitions(current['files'], manifest['files'])
+
+    with _loading_locks[name]:
+        with _partitions_lock:
+            loaded_keys = [key for key in _partitions if key[0] == name and key[2] in changed_years]
+            loaded_views = [key for key in _loaded if key[0] == name]
+
+        built = []
+        for _, columns, year in loaded_keys:
+            files = [file for file in manifest['files'] if file.get('ano') == year]
+            for built_year, frame, cubes in build_partitions(name, files, columns):
+                built.append((columns, built_year, frame, cubes))
+
+        loaded = {}
+        for key in loaded_views:
+            data = build_dataset(name, manifest['files'], columns=key[1])
+            if data is not None:
+                loaded[key] = data
+
+        # Trocar manifesto e dados de uma só vez
+        with _manifest_lock:
+            _manifests[name] = manifest
+        with _partitions_lock:
+            for key in loaded_keys:
+                _partitions.pop(key, None)
+                _cubes.pop(key, None)
+            for columns, year, frame, cubes in built:
+                _partitions[(name, columns, year)] = frame
+                _cubes[(name, columns, year)] = cubes
+            _loaded.update(loaded)
+        for key in loaded_keys:
+            untrack_partition(*key)
+        for columns, year, frame, cubes in built:
+            track_partition(name, columns, year, frame, cubes)
+        for key, data in loaded.items():
+            track_dataset(('base',) + key, data)
+
+        # Descartar apenas as montagens que incluem algum ano alterado
+        discard(lambda key: key[0] in ('montagem', 'montagem_cubo') and key[1] == name and changed_years & set(key[3]))
+
+    logger.info('Base "%s" atualizada para a versão %s (anos alterados: %s)',
+                name, manifest['versao'], sorted(changed_years, key=lambda year: year or 0))
+    return True
+
+# Função para iniciar (uma vez por processo) a verificação periódica de novas versões das bases em memória
+def start_refresher():
+    global _refresher
+    if REFRESH_INTERVAL <= 0:
+        return
+    with _refresher_lock:
+        if _refresher is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(REFRESH_INTERVAL)
+                with _partitions_lock:
+                    names = {key[0] for key in _partitions} | {key[0] for key in _loaded}
+                for name in names:
+                    try:
+                        refresh_dataset(name)
+                    except Exception:
+                        logger.exception('Falha ao atualizar a base "%s"', name)
+
+        _refresher = threading.Thread(target=run, name='dataset-refresher', daemon=True)
+        _refresher.start()
+
+# Função que mantém cada base não anual em memória durante a vida do processo
+# (a projeção de colunas faz parte da chave; novas versões são trocadas por refresh_dataset)
+def load_cached_dataset(name, columns=None, show_progress=True):
+    key = (name, columns)
+    with _partitions_lock:
+        if key in _loaded:
+            return _loaded[key]
+
+    with _loading_locks[name]:
+        with _partitions_lock:
+            if key in _loaded:
+                return _loaded[key]
+
+        # Inicializar a barra de progresso
+        progress_bar = st.progress(0) if show_progress and DATASETS[name]['progresso'] else None
+        with measure('base', base=name) as info:
+            data = load_dataset(name, progress_bar, columns=columns)
+            frames = data.values() if isinstance(data, dict) else [data] if data is not None else []
+            info['linhas'] = sum(len(frame) for frame in frames)
+        if progress_bar is not None:
+            progress_bar.empty()
+
+        if data is not None:
+            with _partitions_lock:
+                _loaded[key] = data
+            track_dataset(('base',) + key, data)
+    return data
+
+# Função para carregar as partições anuais pedidas de uma base, com barra de progresso quando há download
+def load_years(name, years=None, filtros=None):
+    if not get_manifest(name)['files']:
+        return None
+
+    if missing_partitions(name, years):
+        progress_bar = st.progress(0) if DATASETS[name]['progresso'] else None
+        ensure_partitions(name, years, progress_bar)
+        if progress_bar is not None:
+            progress_bar.empty()
+
+    if filtros is not None:
+        return filter_partitions(name, years, **filtros)
+    return assemble_partitions(name, years)
+
+# Função que aquece uma base: carrega todos os anos (do mais recente ao mais antigo, um por vez, para que
+# uma sessão que peça o ano atual não espere pelos anteriores), a base inteira ou as credenciais de login
+def warm_dataset(name):
+    with _warmup_lock:
+        _warmup[name] = 'carregando'
+    try:
+        if name == 'login':
+            loaded = bool(get_credentials())
+        elif DATASETS[name]['layout'] == 'anual':
+            for year in sorted(list_dataset_years(name), reverse=True):
+                ensure_partitions(name, [year])
+            loaded = bool(get_manifest(name)['files'])
+        else:
+            loaded = load_cached_dataset(name, get_projection(name), show_progress=False) is not None
+    except Exception:
+        logger.exception('Falha no aquecimento da base "%s"', name)
+        loaded = False
+    with _warmup_lock:
+        _warmup[name] = 'pronta' if loaded else 'erro'
+
+# Função para iniciar (uma vez por processo) o aquecimento de todas as bases registradas em paralelo.
+# Deve ser chamada depois de importar as páginas, que declaram as colunas usadas de cada base.
+# As sessões que pedirem uma base em carga aguardam o mesmo lock de carga, sem baixá-la de novo.
+def start_warmup():
+    if not WARMUP_DATASETS:
+        return
+    with _warmup_lock:
+        if _warmup:
+            return
+        _warmup.update({name: 'pendente' for name in DATASETS})
+
+    start_refresher()
+
+    def run():
+        with ThreadPoolExecutor(max_workers=max(1, WARMUP_WORKERS), thread_name_prefix='warmup') as executor:
+            list(executor.map(warm_dataset, DATASETS))
+        logger.info('Aquecimento concluído: %s', get_warmup_status())
+
+    threading.Thread(target=run, name='warmup', daemon=True).start()
+
+# Função para consultar a situação do aquecimento: {base: situação} (vazio quando o aquecimento está desligado)
+def get_warmup_status():
+    with _warmup_lock:
+        return dict(_warmup)
+
+# Função que indica se o aquecimento terminou (todas as bases prontas ou com erro)
+def is_warm():
+    return all(state in ('pronta', 'erro') for state in get_warmup_status().values())
+
+# Função para obter uma base registrada, exibindo os avisos de carga no painel.
+# Bases anuais são carregadas por ano (apenas os anos pedidos); as demais ficam no cache do Streamlit.
+# Com filtros ({'filters', 'ranges', 'not_null'}, como em filter_rows), bases anuais devolvem apenas as linhas
+# filtradas de cada ano.
+def get_dataset(name, years=None, filtros=None):
+    start_refresher()
+
+    if DATASETS[name]['layout'] == 'anual':
+        data = load_years(name, years, filtros)
+    else:
+        data = load_cached_dataset(name, get_projection(name))
+
+    if data is None:
+        st.error(DATASETS[name]['mensagem_erro'])
+        return None
+
+    if isinstance(data, pd.DataFrame):
+        missing = missing_columns(name, data)
+        if missing:
+            st.warning(f'A base "{name}" não contém as colunas esperadas: {", ".join(missing)}')
+
+    return data
+
+# Função principal para carregar os dados de despesas e diárias (todos os anos quando anos=None).
+# Com filtros, devolve apenas as linhas filtradas de cada ano (as páginas não precisam da base completa).
+def load_data(anos=None, filtros=None):
     # Apenas uma mensagem de carregamento para a primeira chamada
     loading_message = st.empty()
     loading_message.info("Carregando os dados... Isso pode demorar um pouco.")
 
     # Chamar a função com cache
-    data = load_parquet_data_from_drive()
+    data = get_dataset('despesas', anos, filtros)
 
     # Remover a mensagem de carregamento após os dados serem carregados
     loading_message.empty()
 
-    return data
+    return data if data is not None else pd.DataFrame()
 
-# Função para carregar arquivos de contratos (sem alterações)
-@st.cache_resource
-def load_contracts_data():
-    service = get_drive_service()
-    contract_files = list_contracts_files(service)
+# Função para obter a versão da base em memória (muda quando refresh_dataset troca os dados por uma nova versão)
+def get_dataset_version(name):
+    return get_manifest(name)['versao']
 
-    if not contract_files:
-        st.error('Nenhum arquivo de contratos encontrado no Google Drive.')
-        return pd.DataFrame(), pd.DataFrame()
+# Função para obter o cubo de despesas de uma classificação (ex.: 'DESCRICAO_FUNCAO'), para os anos pedidos.
+# Deve ser chamada depois de load_data com os mesmos anos, que garante as partições em memória.
+def load_cube(classificacao=(), anos=None):
+    return assemble_cube('despesas', classificacao, anos)
 
-    # Procurar os arquivos específicos de aditivos e lista de contratos
-    aditivos_file = next((file for file in contract_files if file['name'] == 'aditivos_reajustes.parquet'), None)
-    contratos_file = next((file for file in contract_files if file['name'] == 'lista_contratos_siafe.parquet'), None)
+# Função para obter a chave e a carga do cubo de despesas com todos os anos já carregados, usados pelos
+# índices de somas acumuladas (query_engine.range_totals com index_key). A chave muda apenas com a versão
+# da base ou quando um novo ano é carregado, de modo que mover o filtro de anos não refaz o índice.
+# Retorna (chave, função que monta o cubo).
+def get_indexed_cube(classificacao=()):
+    name = 'despesas'
+    classification = (classificacao,) if isinstance(classificacao, str) else tuple(classificacao)
+    columns = get_projection(name)
+    with _partitions_lock:
+        years = sorted((year for (cube_name, cube_columns, year) in _cubes
+                        if cube_name == name and cube_columns == columns), key=lambda year: year or 0)
+    key = (name, get_dataset_version(name), columns, tuple(years), classification)
+    return key, lambda: assemble_cube(name, classification, years)
 
-    if not aditivos_file or not contratos_file:
-        st.error('Arquivos "aditivos_reajustes.parquet" ou "lista_contratos_siafe.parquet" não encontrados.')
+# Função para carregar os arquivos de contratos e aditivos
+def load_contracts_data():
+    data = get_dataset('contratos')
+    if data is None:
         return pd.DataFrame(), pd.DataFrame()
-    
-    # Inicializar a barra de progresso
-    progress_bar = st.progress(0)
-    total_files = 2  # Apenas dois arquivos, aditivos e contratos
-
-    # Baixar os arquivos e carregar como DataFrames
-    aditivos_content = download_file_from_drive(service, aditivos_file['id'])
-    contratos_content = download_file_from_drive(service, contratos_file['id'])
-
-    df_aditivos = pq.read_table(aditivos_content).to_pandas()
-    progress_bar.progress(1 / total_files)
-    df_contratos = pq.read_table(contratos_content).to_pandas()
-    progress_bar.progress(2 / total_files)
-
-    return df_aditivos, df_contratos
+    return data['aditivos'], data['contratos']
 
-# Função para carregar o arquivo de servidores (folha de pagamento) do Google Drive
-@st.cache_resource
+# Função para carregar o arquivo de servidores (folha de pagamento)
 def load_servidores_data():
-    service = get_drive_service()
+    data = get_dataset('folha')
+    return data if data is not None else pd.DataFrame()
 
-    # Carregar o ID da pasta do arquivo de folha a partir do .env
-    FOLHA_FOLDER_ID = config['FOLHA_FOLDER_ID']
+# Função para carregar arquivos de dotação
+def load_dotacao_data(anos=None):
+    data = get_dataset('dotacao', anos)
+    return data if data is not None else pd.DataFrame()
 
-    if not FOLHA_FOLDER_ID:
-        st.error('ID da pasta da folha de pagamento não encontrado. Verifique o arquivo .env.')
-        return pd.DataFrame()
+# Função para carregar arquivos de restos a pagar
+def load_restos_data(anos=None, filtros=None):
+    data = get_dataset('restos', anos, filtros)
+    return data if data is not None else pd.DataFrame()
 
-    # pylint: disable=no-member
-    # Listar os arquivos na pasta "folha de pagamento"
-    folha_files = service.files().list(
-        q=f"'{FOLHA_FOLDER_ID}' in parents",
-        fields="files(id, name)",
-        orderBy='createdTime desc'
-    ).execute().get('files', [])
+# Função para carregar arquivos de adiantamentos
+def load_adiantamentos_data(anos=None):
+    data = get_dataset('adiantamentos', anos)
+    return data if data is not None else pd.DataFrame()
 
-    if not folha_files:
-        st.error('Nenhum arquivo de folha de pagamento encontrado na pasta "folha_1_mes" do Google Drive.')
-        return pd.DataFrame()
+# Função para montar o índice de credenciais (usuário sem espaços -> senha) a partir do CSV de login.
+# Com usuários repetidos vale a primeira linha, como na busca original por user_row.iloc[0].
+def build_credentials(df):
+    users = df.assign(username=df['username'].astype(str).str.strip()).drop_duplicates('username', keep='first')
+    return dict(zip(users['username'], users['password'].tolist()))
 
-    # Pegar o primeiro arquivo Parquet encontrado
-    folha_file = next((file for file in folha_files if file['name'].endswith('.parquet')), None)
+# Função que confere no Drive se o arquivo de login mudou e, só nesse caso, baixa e reindexa as credenciais.
+# Em caso de falha, as credenciais anteriores continuam valendo.
+def refresh_credentials():
+    try:
+        manifest = get_manifest('login', refresh=True)
+        with _credentials_lock:
+            unchanged = _credentials['usuarios'] is not None and manifest['versao'] == _credentials['versao']
+        users = None
+        if not unchanged:
+            df_login = build_dataset('login', manifest['files'])
+            users = build_credentials(df_login) if df_login is not None else {}
+        with _credentials_lock:
+            if users is not None:
+                _credentials['usuarios'] = users
+                _credentials['versao'] = manifest['versao']
+            _credentials['conferido_em'] = time.time()
+    except Exception:
+        logger.exception('Falha ao atualizar as credenciais de login')
+    finally:
+        with _credentials_lock:
+            _credentials['atualizando'] = False
 
-    if not folha_file:
-        st.error('Nenhum arquivo .parquet encontrado na pasta "folha de pagamento".')
-        return pd.DataFrame()
-    
-    # Inicializar a barra de progresso
-    progress_bar = st.progress(0)
-
-    # Baixar o arquivo e carregar como DataFrame
-    folha_content = download_file_from_drive(service, folha_file['id'])
-    df_servidores = pq.read_table(folha_content).to_pandas()
-
-    # Atualizar a barra de progresso para 100% após o carregamento do arquivo
-    progress_bar.progress(1.0)
-
-    return df_servidores
-
-# Função para listar arquivos .parquet na pasta de dotação no Google Drive
-def list_dotacao_files(service):
-    DOTACAO_FOLDER_ID = config['DOTACAO_FOLDER_ID']
-    
-    results = service.files().list(
-        q=f"'{DOTACAO_FOLDER_ID}' in parents and mimeType='application/vnd.google-apps.folder'",
-        fields="files(id, name)"
-    ).execute()
-    folders = results.get('files', [])
-    
-    dotacao_files = []
-    for folder in folders:
-        folder_id = folder['id']
-        # Listar os arquivos dentro de cada pasta de ano
-        year_files = service.files().list(
-            q=f"'{folder_id}' in parents and mimeType='application/octet-stream'",
-            fields="files(id, name)"
-        ).execute()
-        for file in year_files.get('files', []):
-            if file['name'].endswith('.parquet'):
-                dotacao_files.append(file)
-    
-    return dotacao_files
-
-# Função para carregar arquivos de dotação do Google Drive
-@st.cache_resource
-def load_dotacao_data():
-    service = get_drive_service()
-    dotacao_files = list_dotacao_files(service)
-    
-    if not dotacao_files:
-        st.error('Nenhum arquivo .parquet encontrado na pasta de dotação do Google Drive.')
-        return pd.DataFrame()
-    
-    # Carregar todos os arquivos .parquet e concatenar
-    data_frames = []
-    #total_files = len(dotacao_files)
-    
-    # Inicializar a barra de progresso
-    #progress_bar = st.progress(0)
-    #for idx, file in enumerate(dotacao_files):
-    for file in dotacao_files:
-        file_content = download_file_from_drive(service, file['id'])
-        data_frames.append(pq.read_table(file_content).to_pandas())
-
-        # Atualizar a barra de progresso
-        #progress_percentage = (idx + 1) / total_files
-        #progress_bar.progress(progress_percentage)
-    
-    return pd.concat(data_frames, ignore_index=True)
-
-# Função para listar arquivos .parquet na pasta de restos a pagar no Google Drive
-def list_restos_files(service):
-    RESTOS_FOLDER_ID = config['RESTOS_FOLDER_ID']
-    
-    results = service.files().list(
-        q=f"'{RESTOS_FOLDER_ID}' in parents and mimeType='application/vnd.google-apps.folder'",
-        fields="files(id, name)"
-    ).execute()
-    folders = results.get('files', [])
-    
-    restos_files = []
-    for folder in folders:
-        folder_id = folder['id']
-        # Listar os arquivos dentro de cada pasta de ano
-        year_files = service.files().list(
-            q=f"'{folder_id}' in parents and mimeType='application/octet-stream'",
-            fields="files(id, name)"
-        ).execute()
-        for file in year_files.get('files', []):
-            if file['name'].endswith('.parquet'):
-                restos_files.append(file)
-    
-    return restos_files
-
-# Função para carregar arquivos de restos a pagar do Google Drive
-@st.cache_resource
-def load_restos_data():
-    service = get_drive_service()
-    restos_files = list_restos_files(service)
-    
-    if not restos_files:
-        st.error('Nenhum arquivo .parquet encontrado na pasta de restos a pagar do Google Drive.')
-        return pd.DataFrame()
-    
-    # Carregar todos os arquivos .parquet e concatenar
-    data_frames = []
-    
-    for file in restos_files:
-        file_content = download_file_from_drive(service, file['id'])
-        data_frames.append(pq.read_table(file_content).to_pandas())
-
-    return pd.concat(data_frames, ignore_index=True)
-
-# Função para listar arquivos .parquet na pasta de adiantamentos no Google Drive
-def list_adiantamentos_files(service):
-    ADIANTAMENTOS_FOLDER_ID = config['ADIANTAMENTOS_FOLDER_ID']
-    
-    results = service.files().list(
-        q=f"'{ADIANTAMENTOS_FOLDER_ID}' in parents and mimeType='application/vnd.google-apps.folder'",
-        fields="files(id, name)"
-    ).execute()
-    folders = results.get('files', [])
-
-    adiantamentos_files = []
-
-    for folder in folders:
-        folder_id = folder['id']
-        # Listar os arquivos dentro de cada pasta de ano
-        year_files = service.files().list(
-            q=f"'{folder_id}' in parents and mimeType='application/octet-stream'",
-            fields="files(id, name)"
-        ).execute()
-        for file in year_files.get('files', []):
-            if file['name'].endswith('.parquet'):
-                adiantamentos_files.append(file)
-
-    return adiantamentos_files
-
-# Função para carregar arquivos de adiantamentos do Google Drive
-@st.cache_resource
-def load_adiantamentos_data():
-    service = get_drive_service()
-    adiantamentos_files = list_adiantamentos_files(service)
+# Função para obter as credenciais de login. A primeira chamada carrega o arquivo; depois, a consulta é feita
+# em memória e, vencido o LOGIN_TTL, a conferência no Drive roda em segundo plano (uma por vez), sem atrasar o login.
+def get_credentials():
+    with _credentials_lock:
+        users = _credentials['usuarios']
+        expired = time.time() - _credentials['conferido_em'] > LOGIN_TTL
+        start = expired and not _credentials['atualizando']
+        if start:
+            _credentials['atualizando'] = True
 
-    if not adiantamentos_files:
-        st.error('Nenhum arquivo .parquet encontrado na pasta de adiantamentos do Google Drive.')
-        return pd.DataFrame()
+    if users is None:
+        # Nenhuma credencial em memória: carregar agora (sessões simultâneas aguardam a mesma carga)
+        with _loading_locks['login']:
+            with _credentials_lock:
+                users = _credentials['usuarios']
+            if users is None:
+                refresh_credentials()
+                with _credentials_lock:
+                    users = _credentials['usuarios']
+    elif start:
+        threading.Thread(target=refresh_credentials, name='login-refresher', daemon=True).start()
+    return users
 
-    # Carregar todos os arquivos .parquet e concatenar
-    data_frames = []
-    total_files = len(adiantamentos_files) 
-
-    # Inicializar a barra de progresso
-    progress_bar = st.progress(0)  
-
-    for idx, file in enumerate(adiantamentos_files):
-        file_content = download_file_from_drive(service, file['id'])
-        data_frames.append(pq.read_table(file_content).to_pandas())
-
-        # Atualizar a barra de progresso
-        progress_percentage = (idx + 1) / total_files  
-        progress_bar.progress(progress_percentage)  
-
-    return pd.concat(data_frames, ignore_index=True)
-
-
-# # Função para listar arquivos .parquet na pasta de adiantamentos no Google Drive
-# def list_adiantamentos_files(service):
-#     ADIANTAMENTOS_FOLDER_ID = config['ADIANTAMENTOS_FOLDER_ID']
-    
-#     # Buscar diretamente os arquivos .parquet na pasta de adiantamentos
-#     results = service.files().list(
-#         q=f"'{ADIANTAMENTOS_FOLDER_ID}' in parents and name contains '.parquet'",
-#         fields="files(id, name)"
-#     ).execute()
-    
-#     return results.get('files', [])
-
-# # Função para carregar arquivos de adiantamentos do Google Drive
-# @st.cache_resource
-# def load_adiantamentos_data():
-#     service = get_drive_service()
-#     adiantamentos_files = list_adiantamentos_files(service)
-    
-#     if not adiantamentos_files:
-#         st.error('Nenhum arquivo .parquet encontrado na pasta de adiantamentos do Google Drive.')
-#         return pd.DataFrame()
-    
-#     # Carregar todos os arquivos .parquet e concatenar
-#     data_frames = []
-    
-#     for file in adiantamentos_files:
-#         file_content = download_file_from_drive(service, file['id'])
-#         data_frames.append(pq.read_table(file_content).to_pandas())
-
-#     return pd.concat(data_frames, ignore_index=True)
\ No newline at end of file
+# Função para carregar as credenciais de login (usuário -> senha), conferindo alterações de usuários no Drive
+def load_login_data():
+    users = get_credentials()
+    if not users:
+        st.error(DATASETS['login']['mensagem_erro'])
+        return {}
+    return users
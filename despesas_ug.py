@@ -3,10 +3,21 @@ import pandas as pd
 import plotly.express as px
 import locale
 from sidebar import load_sidebar
-from data_loader import load_data
+from data_loader import load_data, load_cube, get_indexed_cube, register_columns, list_dataset_years, prefetch_partitions, get_dataset_version
+from query_engine import aggregate, range_totals
+from cache_manager import memoize, normalize_key
 #from chatbot import render_chatbot  # Importar a função do chatbot
 from analyzer import botao_analise
 
+COLUNAS_DESPESAS = [
+    'UG', 'UO', 'ANO', 'MES', 'PODER', 'DESCRICAO_UG', 'DESCRICAO_FUNCAO', 'DESCRICAO_SUB_FUNCAO',
+    'DESCRICAO_FONTE', 'NOME_FAVORECIDO', 'DESCRICAO_NATUREZA', 'DESCRICAO_NATUREZA1', 'DESCRICAO_NATUREZA2',
+    'DESCRICAO_NATUREZA3', 'DESCRICAO_NATUREZA4', 'DESCRICAO_NATUREZA5', 'DESCRICAO_NATUREZA6',
+    'TIPO_LICITACAO', 'UG_EMITENTE', 'NOTA_EMPENHO', 'COD_PROCESSO', 'NOME_CONTRATO', 'OBSERVACAO_NE',
+    'VALOR_EMPENHADO', 'VALOR_LIQUIDADO', 'VALOR_PAGO'
+]
+register_columns('despesas', COLUNAS_DESPESAS)
+
 # Configurar o locale para português do Brasil
 #locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
 
@@ -17,10 +28,10 @@ except locale.Error:
     locale.setlocale(locale.LC_ALL, '')  # Fallback para o locale padrão do sistema
 
 def run_dashboard():
-    # Carregar dados usando o módulo centralizado
-    df = load_data()
+    # Anos disponíveis no Drive (apenas os anos selecionados no sidebar são carregados)
+    anos_disponiveis = list_dataset_years('despesas')
 
-    if df is None:
+    if not anos_disponiveis:
         st.error("Nenhum dado foi carregado. Por favor, verifique os arquivos de entrada.")
         return
 
@@ -47,32 +58,39 @@ def run_dashboard():
 
    
     # Carregar o sidebar
-    selected_ugs_despesas, selected_ano, selected_mes = load_sidebar(df, "despesas_ug")
+    selected_ugs_despesas, selected_ano, selected_mes = load_sidebar(None, "despesas_ug", anos=anos_disponiveis)
+
+    # Anos selecionados no sidebar (apenas eles são carregados, pelo módulo centralizado)
+    anos_selecionados = range(selected_ano[0], selected_ano[1] + 1)
+    versao_despesas = get_dataset_version('despesas')
 
     # Chame o chatbot para renderizar no sidebar
     #render_chatbot()
 
-    if df is not None:
-        # Filtrar dados apenas para o Poder Executivo
-        df = df[df['PODER'] == 'EXE']
-
+    # Filtros do sidebar (apenas Poder Executivo e sem linhas em branco nas colunas de interesse),
+    # aplicados diretamente nas consultas de agregação do query_engine
+    filtros_consulta = {
+        'filters': {'PODER': ['EXE'], 'UG': selected_ugs_despesas},
+        'ranges': {'ANO': selected_ano, 'MES': selected_mes},
+        'not_null': ['UO', 'UG', 'ANO', 'MES'],
+    }
 
-    # Aplicar filtros ao dataframe
-    df_filtered = df[df['UG'].isin(selected_ugs_despesas)]
-    df_filtered = df_filtered[(df_filtered['ANO'] >= selected_ano[0]) & (df_filtered['ANO'] <= selected_ano[1])]
-    df_filtered = df_filtered[(df_filtered['MES'] >= selected_mes[0]) & (df_filtered['MES'] <= selected_mes[1])]
+    chave = ('despesas_ug', versao_despesas, normalize_key(filtros_consulta))
 
-    # Eliminar linhas com valores em branco nas colunas de interesse
-    df_filtered = df_filtered.dropna(subset=['UO', 'UG', 'ANO', 'MES'])
+    # Linhas filtradas dos anos selecionados, usadas apenas nas visões detalhadas
+    df_filtered = memoize(chave + ('linhas',), lambda: load_data(anos_selecionados, filtros_consulta), copy=False)
 
-    # Tratamento de dados
-    df_filtered['VALOR_EMPENHADO'] = df_filtered['VALOR_EMPENHADO'].apply(pd.to_numeric, errors='coerce')
-    df_filtered['VALOR_LIQUIDADO'] = df_filtered['VALOR_LIQUIDADO'].apply(pd.to_numeric, errors='coerce')
-    df_filtered['VALOR_PAGO'] = df_filtered['VALOR_PAGO'].apply(pd.to_numeric, errors='coerce')
+    prefetch_partitions('despesas')
 
-    # Obter a quantidade de despesas e valor total
-    quantidade_despesas = len(df_filtered)
-    valor_total_despesas = df_filtered['VALOR_PAGO'].sum()
+    # Obter a quantidade de despesas e valor total (somas acumuladas do cubo de todos os anos carregados:
+    # O(1) por UG a cada movimento dos sliders de ano e de mês)
+    chave_indice, carregar_cubo = get_indexed_cube()
+    totais = memoize(
+        chave + ('totais',),
+        lambda: range_totals(carregar_cubo, ['VALOR_PAGO', 'QUANTIDADE'], index_key=chave_indice, **filtros_consulta)
+    )
+    quantidade_despesas = int(totais['QUANTIDADE'])
+    valor_total_despesas = totais['VALOR_PAGO']
 
     # Formatar valor total para moeda
     #valor_total_formatado = locale.currency(valor_total_despesas, grouping=True)
@@ -107,7 +125,10 @@ def run_dashboard():
 
         with col5:
             # Preparar dados para o gráfico de despesas por ano
-            df_ano = df_filtered.groupby('ANO')['VALOR_PAGO'].sum().reset_index()
+            df_ano = memoize(
+                chave + ('ano',),
+                lambda: aggregate(load_cube(anos=anos_selecionados), 'ANO', 'VALOR_PAGO', **filtros_consulta)
+            )
             df_ano['VALOR_PAGO_ABREVIADO'] = df_ano['VALOR_PAGO'].apply(format_currency)
 
             # Criar o gráfico de barras com valores abreviados
@@ -132,7 +153,10 @@ def run_dashboard():
 
         with col6:
             # Preparar dados para o gráfico de despesas por função
-            df_funcao = df_filtered.groupby('DESCRICAO_FUNCAO')['VALOR_PAGO'].sum().reset_index()
+            df_funcao = memoize(
+                chave + ('funcao',),
+                lambda: aggregate(load_cube('DESCRICAO_FUNCAO', anos_selecionados), 'DESCRICAO_FUNCAO', 'VALOR_PAGO', **filtros_consulta)
+            )
             fig_funcao = px.pie(
                 df_funcao, 
                 values='VALOR_PAGO', 
@@ -146,7 +170,7 @@ def run_dashboard():
 
     # Gráfico de Despesas Mensais do Ano Corrente
         st.markdown("### Despesas Mensais do Ano Corrente")
-        ano_corrente = df_filtered['ANO'].max()
+        ano_corrente = df_ano['ANO'].max()
 
         # Mapear os números dos meses para os nomes dos meses
         meses_map = {
@@ -154,7 +178,13 @@ def run_dashboard():
             7: 'Julho', 8: 'Agosto', 9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'
         }
 
-        df_ano_corrente = df_filtered[df_filtered['ANO'] == ano_corrente].groupby('MES')['VALOR_PAGO'].sum().reset_index()
+        df_ano_corrente = memoize(
+            chave + ('ano_corrente',),
+            lambda: aggregate(
+                load_cube(anos=anos_selecionados), 'MES', 'VALOR_PAGO',
+                **dict(filtros_consulta, ranges={'ANO': (ano_corrente, ano_corrente), 'MES': selected_mes})
+            )
+        )
         df_ano_corrente['MES'] = df_ano_corrente['MES'].map(meses_map)
         df_ano_corrente['VALOR_PAGO_ABREVIADO'] = df_ano_corrente['VALOR_PAGO'].apply(format_currency)
 
@@ -212,7 +242,10 @@ def run_dashboard():
         # Função para criar gráficos de barras horizontais
         def plot_bar_chart(df, group_col, title, x_label, y_label, color='#E55115', max_chars=90):
             # Agrupar os dados por coluna e calcular a soma dos valores
-            df_grouped = df.groupby(group_col)['VALOR_PAGO'].sum().reset_index()
+            df_grouped = memoize(
+                chave + ('grafico', group_col),
+                lambda: aggregate(df, group_col, 'VALOR_PAGO', **filtros_consulta)
+            )
             df_grouped['VALOR_PAGO_FORMATADO'] = df_grouped['VALOR_PAGO'].apply(
                 lambda x: f"R$ {x:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") if pd.notnull(x) else "R$ 0,00"
             )
@@ -252,10 +285,10 @@ def run_dashboard():
         st.markdown("### Gráficos de Despesas por Subfunção e Fonte de Recurso")
 
         # Gráfico de Barras: Despesas por Subfunção
-        tabela_subfuncao = plot_bar_chart(df_filtered, 'DESCRICAO_SUB_FUNCAO', 'Despesas por Subfunção', 'Valor Pago', 'Subfunção')
+        tabela_subfuncao = plot_bar_chart(load_cube('DESCRICAO_SUB_FUNCAO', anos_selecionados), 'DESCRICAO_SUB_FUNCAO', 'Despesas por Subfunção', 'Valor Pago', 'Subfunção')
 
         # Gráfico de Barras: Despesas por Fonte de Recurso
-        tabela_fonte = plot_bar_chart(df_filtered, 'DESCRICAO_FONTE', 'Despesas por Fonte de Recurso', 'Valor Pago', 'Fonte de Recurso')
+        tabela_fonte = plot_bar_chart(load_cube('DESCRICAO_FONTE', anos_selecionados), 'DESCRICAO_FONTE', 'Despesas por Fonte de Recurso', 'Valor Pago', 'Fonte de Recurso')
 
         # Preparar tabelas para análise
         tabela_subfuncao = tabela_subfuncao[['DESCRICAO_SUB_FUNCAO', 'VALOR_PAGO']]
@@ -286,7 +319,10 @@ def run_dashboard():
     with tab3:
 
         # Gráfico de Barras: Despesas por Favorecido
-        df_favorecido = df_filtered.groupby('NOME_FAVORECIDO')['VALOR_PAGO'].sum().reset_index()
+        df_favorecido = memoize(
+            chave + ('favorecido',),
+            lambda: aggregate(df_filtered, 'NOME_FAVORECIDO', 'VALOR_PAGO', **filtros_consulta)
+        )
         df_favorecido = df_favorecido.sort_values(by='VALOR_PAGO', ascending=False).head(10)  # Exibir os 10 maiores favorecidos
         
         # Limitar os nomes dos favorecidos a 90 caracteres
@@ -344,7 +380,10 @@ def run_dashboard():
         coluna_selecionada = opcoes_natureza[selecao_natureza]
 
         # Agrupar os dados pela natureza selecionada e somar os valores pagos
-        df_natureza = df_filtered.groupby(coluna_selecionada)['VALOR_PAGO'].sum().reset_index()
+        df_natureza = memoize(
+            chave + ('natureza', coluna_selecionada),
+            lambda: aggregate(load_cube(coluna_selecionada, anos_selecionados), coluna_selecionada, 'VALOR_PAGO', **filtros_consulta)
+        )
         df_natureza = df_natureza[df_natureza['VALOR_PAGO'] > 0]
         df_natureza['VALOR_PAGO_FORMATADO'] = df_natureza['VALOR_PAGO'].apply(format_currency)
 
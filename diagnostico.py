@@ -0,0 +1,87 @@
+import streamlit as st
+import pandas as pd
+from sidebar import render_logout_button
+from auth_utils import is_admin
+from data_loader import DATASETS, get_warmup_status, get_encoding_report
+from cache_manager import get_cache_usage, get_cache_report
+from metrics import get_metrics, get_metrics_summary, clear_metrics
+
+# Função para formatar uma quantidade de bytes em MB
+def format_mb(value):
+    return f"{value / 1024 / 1024:,.1f} MB"
+
+def run_dashboard():
+    # Exibe o botão de logout no sidebar
+    render_logout_button()
+
+    # Página restrita: a navegação só mostra o diagnóstico para administradores, mas a checagem é refeita aqui
+    if not is_admin():
+        st.error("Acesso restrito aos administradores do painel.")
+        return
+
+    st.title('Diagnóstico da carga de dados')
+
+    # ========= AQUECIMENTO =========
+    st.subheader('Aquecimento das bases')
+    warmup_status = get_warmup_status()
+    if warmup_status:
+        st.dataframe(
+            pd.DataFrame(list(warmup_status.items()), columns=['base', 'situacao']),
+            use_container_width=True, hide_index=True
+        )
+    else:
+        st.info("O aquecimento das bases está desligado (WARMUP_DATASETS).")
+
+    # ========= MEMÓRIA =========
+    st.subheader('Memória em cache')
+    usage = get_cache_usage()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric('Bases carregadas', format_mb(usage['bases_bytes']), f"{usage['bases']} itens", delta_color='off')
+    col2.metric('Itens derivados', format_mb(usage['derivados_bytes']), f"{usage['itens_derivados']} itens", delta_color='off')
+    col3.metric('Total / teto', format_mb(usage['total_bytes']), f"teto {format_mb(usage['teto_bytes'])}", delta_color='off')
+    col4.metric('Acertos / faltas', f"{usage['acertos']} / {usage['faltas']}", f"{usage['descartes']} descartes", delta_color='off')
+
+    cache_report = get_cache_report()
+    if not cache_report.empty:
+        resumo = cache_report.groupby('tipo')['bytes'].agg(itens='count', bytes='sum').reset_index()
+        st.dataframe(resumo, use_container_width=True, hide_index=True)
+        with st.expander('Itens em cache'):
+            st.dataframe(cache_report.sort_values('bytes', ascending=False), use_container_width=True, hide_index=True)
+
+    # ========= MEDIÇÕES DA CARGA =========
+    st.subheader('Etapas da carga')
+    metrics = get_metrics()
+    if metrics.empty:
+        st.info("Nenhuma medição registrada desde o início do processo.")
+    else:
+        st.markdown('**Resumo por etapa e base**')
+        st.dataframe(get_metrics_summary(), use_container_width=True, hide_index=True)
+
+        # Arquivos mais lentos (download e leitura), para localizar arquivos problemáticos
+        # (memoria_arrow e pico_python são a memória Arrow e Python/numpy da etapa, aproximadas quando há leituras em paralelo)
+        st.markdown('**Arquivos mais lentos**')
+        arquivos = metrics[metrics['etapa'].isin(['download', 'leitura'])]
+        st.dataframe(
+            arquivos.sort_values('segundos', ascending=False).head(20)[
+                ['momento', 'etapa', 'base', 'ano', 'arquivo', 'segundos', 'bytes', 'linhas', 'memoria_arrow', 'pico_python']
+            ],
+            use_container_width=True, hide_index=True
+        )
+
+        with st.expander('Todas as medições'):
+            st.dataframe(metrics.sort_values('momento', ascending=False), use_container_width=True, hide_index=True)
+
+        if st.button('Limpar medições'):
+            clear_metrics()
+            st.rerun()
+
+    # ========= CATEGORIAS =========
+    st.subheader('Conversão de textos em categorias')
+    for name, spec in DATASETS.items():
+        if not spec.get('categorias'):
+            continue
+        report = get_encoding_report(name)
+        if report.empty:
+            continue
+        st.markdown(f'**{name}**')
+        st.dataframe(report, use_container_width=True, hide_index=True)
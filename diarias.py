@@ -4,12 +4,21 @@ import plotly.express as px
 import plotly.graph_objects as go
 import locale
 from sidebar import load_sidebar
-from data_loader import load_data
+from data_loader import load_data, load_cube, get_indexed_cube, register_columns, list_dataset_years, prefetch_partitions, get_dataset_version
+from query_engine import aggregate, range_totals
+from cache_manager import memoize, normalize_key
 #from chatbot import render_chatbot  # Importar a função do chatbot
 from analyzer import botao_analise
 from wordcloud import WordCloud
 import matplotlib.pyplot as plt
 
+COLUNAS_DESPESAS = [
+    'UG', 'ANO', 'MES', 'PODER', 'DESCRICAO_UG', 'DESCRICAO_NATUREZA', 'DESCRICAO_NATUREZA6',
+    'CODIGO_FAVORECIDO', 'NOME_FAVORECIDO', 'COD_PROCESSO', 'NOTA_EMPENHO', 'OBSERVACAO_NE',
+    'VALOR_EMPENHADO', 'VALOR_PAGO'
+]
+register_columns('despesas', COLUNAS_DESPESAS)
+
 # Configurar o locale para português do Brasil
 #locale.setlocale(locale.LC_ALL, 'pt_BR.UTF-8')
 
@@ -27,16 +36,20 @@ def formatar_valor(valor):
     return 'R$ 0,00'
     
 def run_dashboard():
-    # Carregar dados usando o módulo centralizado
-    df = load_data()
+    # Anos disponíveis no Drive (apenas os anos selecionados no sidebar são carregados)
+    anos_disponiveis = list_dataset_years('despesas')
 
-    if df is None:
+    if not anos_disponiveis:
         st.error("Nenhum dado foi carregado. Por favor, verifique os arquivos de entrada.")
         return
 
     # Carregar o sidebar
-    selected_ugs_despesas, selected_ano, selected_mes = load_sidebar(df, "diarias")
-    
+    selected_ugs_despesas, selected_ano, selected_mes = load_sidebar(None, "diarias", anos=anos_disponiveis)
+
+    # Anos selecionados no sidebar (apenas eles são carregados, pelo módulo centralizado)
+    anos_selecionados = range(selected_ano[0], selected_ano[1] + 1)
+    versao_despesas = get_dataset_version('despesas')
+
     # Verificar se nenhuma UG foi selecionada
     if not selected_ugs_despesas:
         st.warning("Nenhuma UG selecionada. Por favor, selecione uma UG para visualizar os dados.")
@@ -45,21 +58,40 @@ def run_dashboard():
     # Chame o chatbot para renderizar no sidebar
     #render_chatbot()
 
-    if df is not None:
-        # Filtrar dados apenas para o Poder Executivo
-        df = df[df['PODER'] == 'EXE']
+    # Filtros do sidebar (apenas Poder Executivo) e filtro das naturezas de diárias
+    filtros_sidebar = {
+        'filters': {'UG': selected_ugs_despesas, 'PODER': ['EXE']},
+        'ranges': {'ANO': selected_ano, 'MES': selected_mes},
+    }
+    filtros_consulta = dict(
+        filtros_sidebar,
+        filters=dict(filtros_sidebar['filters'], DESCRICAO_NATUREZA6=['DIARIAS - CIVIL', 'DIARIAS - MILITAR'])
+    )
+
+    chave = ('diarias', versao_despesas, normalize_key(filtros_sidebar))
 
-    # Aplicar filtros ao dataframe
-    df_filtered = df[df['UG'].isin(selected_ugs_despesas)]
-    df_filtered = df_filtered[(df_filtered['ANO'] >= selected_ano[0]) & (df_filtered['ANO'] <= selected_ano[1])]
-    df_filtered = df_filtered[(df_filtered['MES'] >= selected_mes[0]) & (df_filtered['MES'] <= selected_mes[1])]
+    # Linhas filtradas dos anos selecionados
+    df_filtered = memoize(chave + ('linhas',), lambda: load_data(anos_selecionados, filtros_sidebar), copy=False)
+
+    prefetch_partitions('despesas')
 
     # Filtrar dados de diárias
-    df_diarias = df_filtered[df_filtered['DESCRICAO_NATUREZA6'].isin(['DIARIAS - CIVIL', 'DIARIAS - MILITAR'])]
+    df_diarias = memoize(
+        chave + ('diarias',),
+        lambda: df_filtered[df_filtered['DESCRICAO_NATUREZA6'].isin(['DIARIAS - CIVIL', 'DIARIAS - MILITAR'])],
+        copy=False
+    )
+
+    # Cubo pré-agregado de despesas (natureza 6 x natureza)
+    cubo_diarias = load_cube(('DESCRICAO_NATUREZA6', 'DESCRICAO_NATUREZA'), anos_selecionados)
 
     # Calcular as métricas
     quantidade_despesas = df_diarias[df_diarias['VALOR_PAGO'] > 0].shape[0]
-    valor_total_diarias = df_diarias['VALOR_PAGO'].sum()
+    chave_indice, carregar_cubo = get_indexed_cube(('DESCRICAO_NATUREZA6', 'DESCRICAO_NATUREZA'))
+    valor_total_diarias = memoize(
+        chave + ('total',),
+        lambda: range_totals(carregar_cubo, 'VALOR_PAGO', index_key=chave_indice, **filtros_consulta)['VALOR_PAGO']
+    )
     #valor_total_formatado = locale.currency(valor_total_diarias, grouping=True)
     valor_total_formatado = f"R$ {valor_total_diarias:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
 
@@ -98,7 +130,10 @@ def run_dashboard():
         }
 
         with col3:
-            df_mensal = df_diarias.groupby('MES')[['VALOR_EMPENHADO', 'VALOR_PAGO']].sum().reset_index()
+            df_mensal = memoize(
+                chave + ('mensal',),
+                lambda: aggregate(cubo_diarias, 'MES', ['VALOR_EMPENHADO', 'VALOR_PAGO'], **filtros_consulta)
+            )
             df_mensal = df_mensal.rename(columns=colunas_exibicao)  # Renomear as colunas
             fig_mensal = px.line(
                 df_mensal, 
@@ -113,7 +148,10 @@ def run_dashboard():
             st.plotly_chart(fig_mensal)
 
         with col4:
-            df_categoria = df_diarias.groupby('DESCRICAO_NATUREZA')[['VALOR_EMPENHADO', 'VALOR_PAGO']].sum().reset_index()
+            df_categoria = memoize(
+                chave + ('categoria',),
+                lambda: aggregate(cubo_diarias, 'DESCRICAO_NATUREZA', ['VALOR_EMPENHADO', 'VALOR_PAGO'], **filtros_consulta)
+            )
             df_categoria = df_categoria.rename(columns=colunas_exibicao)  # Renomear as colunas
             fig_pizza = px.pie(
                 df_categoria,
@@ -185,7 +223,7 @@ def run_dashboard():
     with tab2:
 
         # Agrupar por favorecido e calcular o valor total pago
-        df_total_por_favorecido = df_diarias.groupby('NOME_FAVORECIDO')['VALOR_PAGO'].sum().reset_index()
+        df_total_por_favorecido = df_diarias.groupby('NOME_FAVORECIDO', observed=True)['VALOR_PAGO'].sum().reset_index()
 
         # Filtrar para exibir apenas valores maiores que 0
         df_total_por_favorecido = df_total_por_favorecido[df_total_por_favorecido['VALOR_PAGO'] > 0]
@@ -437,7 +475,7 @@ def run_dashboard():
         mostrar_tabela = False
 
         # Agrupar os dados de favorecidos
-        df_favorecidos = df_diarias.groupby(['CODIGO_FAVORECIDO','NOME_FAVORECIDO', 'DESCRICAO_NATUREZA', 'COD_PROCESSO', 'NOTA_EMPENHO', 'OBSERVACAO_NE', 'MES', 'ANO']).agg({'VALOR_PAGO': 'sum'}).reset_index()
+        df_favorecidos = df_diarias.groupby(['CODIGO_FAVORECIDO','NOME_FAVORECIDO', 'DESCRICAO_NATUREZA', 'COD_PROCESSO', 'NOTA_EMPENHO', 'OBSERVACAO_NE', 'MES', 'ANO'], observed=True).agg({'VALOR_PAGO': 'sum'}).reset_index()
 
         # Criar a coluna 'Período' com o formato 'MM/AAAA'
         df_favorecidos['Período'] = df_favorecidos['ANO'].astype(str) + '/' +  df_favorecidos['MES'].astype(str).str.zfill(2)
@@ -510,7 +548,7 @@ def run_dashboard():
         servidores_outras_ugs = servidores_outras_ugs[~servidores_outras_ugs['UG'].isin(selected_ugs_despesas)]
 
     # Agrupar por servidor e calcular o valor total recebido de outras UGs
-        df_servidores_outras_ugs = servidores_outras_ugs.groupby('NOME_FAVORECIDO')['VALOR_PAGO'].sum().reset_index()
+        df_servidores_outras_ugs = servidores_outras_ugs.groupby('NOME_FAVORECIDO', observed=True)['VALOR_PAGO'].sum().reset_index()
         df_servidores_outras_ugs = df_servidores_outras_ugs.rename(columns={'NOME_FAVORECIDO': 'Nome do Servidor', 'VALOR_PAGO': 'Valor de Outras UGs'})
 
     # Verificar se há dados para exibir no gráfico
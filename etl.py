@@ -0,0 +1,40 @@
+import argparse
+import logging
+from data_loader import DATASETS, compact_dataset
+
+# Bases com layout anual que podem ser compactadas
+BASES_ANUAIS = [name for name, spec in DATASETS.items() if spec['layout'] == 'anual']
+
+# Função para interpretar os argumentos da linha de comando
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compacta as bases anuais (do Google Drive ou da pasta local, conforme STORAGE_BACKEND) em um '
+                    'parquet local por ano, unido e ordenado por UG, ANO e MES, lido pelo data_loader no lugar dos '
+                    'arquivos originais enquanto estiver na mesma versão (a carga do ano dispensa download, '
+                    'concatenação e ordenação).'
+    )
+    # Sem choices: o argparse compararia a lista padrão inteira com as opções; os nomes são validados abaixo
+    parser.add_argument('bases', nargs='*', help=f'Bases a compactar: {", ".join(BASES_ANUAIS)} (padrão: despesas)')
+    parser.add_argument('--anos', nargs='+', type=int, help='Compactar apenas estes anos')
+    parser.add_argument('--forcar', action='store_true', help='Recompactar mesmo os anos já atualizados')
+    args = parser.parse_args()
+
+    args.bases = args.bases or ['despesas']
+    invalid = [name for name in args.bases if name not in BASES_ANUAIS]
+    if invalid:
+        parser.error(f'base(s) inválida(s): {", ".join(invalid)} (opções: {", ".join(BASES_ANUAIS)})')
+    return args
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    args = parse_args()
+
+    for name in args.bases:
+        compacted = compact_dataset(name, set(args.anos) if args.anos else None, args.forcar)
+        if not compacted:
+            logging.info('Base "%s": nenhum ano desatualizado.', name)
+        for year, meta in compacted.items():
+            logging.info('Base "%s", ano %s: %s linhas.', name, year, meta['linhas'])
+
+if __name__ == '__main__':
+    main()
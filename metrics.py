@@ -0,0 +1,128 @@
+import streamlit as st
+import pandas as pd
+import pyarrow as pa
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+config = st.secrets
+
+# Quantidade de medições mantidas em memória para a página de diagnóstico (as mais antigas saem primeiro)
+METRICS_HISTORY = int(config.get('METRICS_HISTORY', 5000))
+
+# Liga o tracemalloc para medir também a memória Python/numpy de cada etapa (normalização, cubos, conversão).
+# Desligado por padrão: o rastreamento deixa as alocações mais lentas enquanto estiver ativo.
+METRICS_TRACEMALLOC = bool(config.get('METRICS_TRACEMALLOC', False))
+if METRICS_TRACEMALLOC and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+# Permite desligar a gravação das medições no log do servidor (a página de diagnóstico continua recebendo-as)
+METRICS_LOG = bool(config.get('METRICS_LOG', True))
+
+# Logger próprio das medições: cada etapa gera uma linha JSON, fácil de filtrar e agregar nos logs do servidor.
+# O painel não configura o logging da aplicação, então o logger recebe seu próprio handler (uma única vez,
+# mesmo que o módulo seja recarregado) e não repassa as linhas ao logger raiz.
+logger = logging.getLogger('painel.metricas')
+if METRICS_LOG and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_events = deque(maxlen=METRICS_HISTORY)
+_lock = threading.Lock()
+
+# Função para obter os bytes alocados pelo Arrow no momento (tabelas decodificadas e ainda não liberadas)
+def arrow_memory():
+    return pa.total_allocated_bytes()
+
+# Função para registrar uma medição de uma etapa da carga.
+# - etapa: 'listagem', 'download', 'leitura', 'mapeamento', 'concatenacao', 'conversao', 'normalizacao', 'cubos',
+#   'base', ...
+# - base, ano e arquivo identificam o que foi medido; bytes e linhas são opcionais
+# - memoria_arrow: variação da memória alocada pelo Arrow durante a etapa (positiva na leitura de um arquivo,
+#   negativa na conversão para pandas, que libera as colunas Arrow); etapas simultâneas em outras threads
+#   também entram na variação, então o valor é aproximado durante downloads paralelos
+# - pico_python: com METRICS_TRACEMALLOC, pico de memória Python/numpy acima do início da etapa (mesma ressalva)
+def record(etapa, segundos, base=None, ano=None, arquivo=None, bytes=None, linhas=None, memoria_arrow=None,
+           pico_python=None, **extra):
+    event = {
+        'momento': time.time(),
+        'etapa': etapa,
+        'base': base,
+        'ano': ano,
+        'arquivo': arquivo,
+        'segundos': round(segundos, 4),
+        'bytes': bytes,
+        'linhas': linhas,
+        'memoria_arrow': memoria_arrow,
+        'pico_python': pico_python,
+        'thread': threading.current_thread().name,
+    }
+    event.update(extra)
+    with _lock:
+        _events.append(event)
+    logger.info(json.dumps(event, default=str, ensure_ascii=False))
+    return event
+
+# Contexto que mede o tempo de uma etapa e registra a medição ao final (inclusive quando a etapa falha).
+# O dicionário devolvido recebe os valores conhecidos só durante a etapa (ex.: bytes baixados, linhas lidas).
+@contextmanager
+def measure(etapa, base=None, ano=None, arquivo=None):
+    info = {}
+    start = time.perf_counter()
+    memory_start = arrow_memory()
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        python_start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    try:
+        yield info
+    except Exception:
+        info['erro'] = True
+        raise
+    finally:
+        info.setdefault('memoria_arrow', arrow_memory() - memory_start)
+        if tracing:
+            info.setdefault('pico_python', tracemalloc.get_traced_memory()[1] - python_start)
+        record(etapa, time.perf_counter() - start, base=base, ano=ano, arquivo=arquivo, **info)
+
+# Função para consultar as medições registradas (mais recentes por último)
+def get_metrics():
+    with _lock:
+        events = list(_events)
+    frame = pd.DataFrame(events)
+    if not frame.empty:
+        frame['momento'] = pd.to_datetime(frame['momento'], unit='s')
+    return frame
+
+# Função para resumir as medições por etapa e base: quantidade, tempo total e máximo, bytes, linhas
+# e a maior memória de uma única medição (ex.: o arquivo que mais ocupou memória ao ser lido)
+def get_metrics_summary():
+    frame = get_metrics()
+    if frame.empty:
+        return frame
+    return (
+        frame.groupby(['etapa', frame['base'].fillna('-')])
+        .agg(
+            medicoes=('segundos', 'size'),
+            segundos_total=('segundos', 'sum'),
+            segundos_max=('segundos', 'max'),
+            bytes=('bytes', 'sum'),
+            linhas=('linhas', 'sum'),
+            memoria_arrow_max=('memoria_arrow', 'max'),
+            pico_python_max=('pico_python', 'max'),
+        )
+        .reset_index()
+        .sort_values('segundos_total', ascending=False)
+    )
+
+# Função para descartar as medições em memória
+def clear_metrics():
+    with _lock:
+        _events.clear()
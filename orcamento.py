@@ -3,7 +3,12 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from sidebar import load_sidebar
-from data_loader import load_dotacao_data, load_data, load_restos_data   # Importa bases de DOTAÇÃO e DESPESAS
+from data_loader import load_dotacao_data, load_data, load_cube, load_restos_data, register_columns, get_dataset_version   # Importa bases de DOTAÇÃO e DESPESAS
+from query_engine import aggregate, filter_rows
+from cache_manager import memoize, normalize_key
+
+COLUNAS_DESPESAS = ['UG', 'ANO', 'VALOR_EMPENHADO', 'VALOR_LIQUIDADO', 'VALOR_PAGO']
+register_columns('despesas', COLUNAS_DESPESAS)
 
 # Função para formatar valores abreviados
 def format_value_abbr(value):
@@ -39,21 +44,13 @@ colunas_formatadas = {
 }
 
 def run_dashboard():
-    # Carregar dados de dotação orçamentária e despesas
+    # Carregar dados de dotação orçamentária (base dos filtros do sidebar)
     df_dotacao = load_dotacao_data()
-    df_despesas = load_data().copy()
-    df_restos = load_restos_data()
-
 
-    if df_dotacao.empty or df_despesas.empty or df_restos.empty:
+    if df_dotacao.empty:
         st.error("Erro: Dados não carregados corretamente. Verifique se os arquivos .parquet estão na pasta correta no Google Drive.")
         return
 
-    # Normalizar os nomes das colunas (mantendo maiúsculas para evitar erro)
-    df_dotacao.columns = df_dotacao.columns.str.strip().str.upper()
-    df_despesas.columns = df_despesas.columns.str.strip().str.upper()
-    df_restos.columns = df_restos.columns.str.strip().str.upper()
-
     # Garantir que as colunas necessárias existem
     required_columns_dotacao = {"ANO", "UG", "PODER", "UO", "FUNCAO", "VALOR_DOTACAO_INICIAL"}
     required_columns_despesas = {"ANO", "UG", "VALOR_EMPENHADO", "VALOR_LIQUIDADO", "VALOR_PAGO"}
@@ -62,10 +59,6 @@ def run_dashboard():
         st.error(f"Erro: O dataset de dotação não contém todas as colunas necessárias: {required_columns_dotacao}")
         return
 
-    if not required_columns_despesas.issubset(df_despesas.columns):
-        st.error(f"Erro: O dataset de despesas não contém todas as colunas necessárias: {required_columns_despesas}")
-        return
-
     # Carregar os filtros do sidebar
     filtros_sidebar = load_sidebar(df_dotacao, "Orçamento")
 
@@ -75,39 +68,34 @@ def run_dashboard():
 
     selected_ugs_orcamento, selected_ano, selected_mes = filtros_sidebar
 
-    # Garantir que MES seja numérico para evitar erros de comparação
-    df_restos["MES"] = pd.to_numeric(df_restos["MES"], errors="coerce")
-
-    # Garantir que UG está no mesmo formato (string)
-    df_restos["UG"] = df_restos["UG"].astype(str)
-    df_dotacao["UG"] = df_dotacao["UG"].astype(str)
-    selected_ugs_orcamento = [str(ug) for ug in selected_ugs_orcamento]
-
-    # Garantir que ANO é numérico
-    df_restos["ANO"] = pd.to_numeric(df_restos["ANO"], errors="coerce")
-    df_dotacao["ANO"] = pd.to_numeric(df_dotacao["ANO"], errors="coerce")
+    # UG, ANO e MES já chegam como inteiros do estágio de normalização do data_loader
+    anos_selecionados = range(int(selected_ano[0]), int(selected_ano[1]) + 1)
     selected_ano = [int(selected_ano[0]), int(selected_ano[1])]
+    versoes = tuple(get_dataset_version(name) for name in ('despesas', 'restos', 'dotacao'))
 
     # Filtrar os dados conforme os filtros do sidebar
-    df_dotacao_filtered = df_dotacao[df_dotacao["UG"].isin(selected_ugs_orcamento)]
-    df_dotacao_filtered = df_dotacao_filtered[
-        (df_dotacao_filtered["ANO"] >= selected_ano[0]) & 
-        (df_dotacao_filtered["ANO"] <= selected_ano[1])
-    ]
-
-    df_despesas_filtered = df_despesas[df_despesas["UG"].isin(selected_ugs_orcamento)]
-    df_despesas_filtered = df_despesas_filtered[
-        (df_despesas_filtered["ANO"] >= selected_ano[0]) & 
-        (df_despesas_filtered["ANO"] <= selected_ano[1])
-    ]
-
-    # Filtrar os datasets conforme os filtros selecionados, incluindo o mês 0
-    df_restos_filtered = df_restos[df_restos["UG"].isin(selected_ugs_orcamento)]
-    df_restos_filtered = df_restos_filtered[
-        (df_restos_filtered["ANO"] >= selected_ano[0]) & 
-        (df_restos_filtered["ANO"] <= selected_ano[1]) & 
-        (df_restos_filtered["MES"].between(0, 12))  # Inclui mês 0 até 12
-    ]
+    df_dotacao_filtered = filter_rows(df_dotacao, filters={"UG": selected_ugs_orcamento}, ranges={"ANO": selected_ano})
+
+    # Filtros de despesas e restos a pagar, aplicados diretamente nas consultas de agregação do query_engine
+    filtros_consulta = {
+        'filters': {'UG': selected_ugs_orcamento},
+        'ranges': {'ANO': selected_ano},
+    }
+
+    chave = ('orcamento', versoes, normalize_key(filtros_consulta))
+
+    # Carregar despesas e restos a pagar apenas dos anos selecionados, já filtrados pelas UGs do sidebar
+    df_despesas = memoize(chave + ('linhas_despesas',), lambda: load_data(anos_selecionados, filtros_consulta), copy=False)
+    df_restos = memoize(chave + ('linhas_restos',), lambda: load_restos_data(anos_selecionados, filtros_consulta), copy=False)
+
+    # Uma base sem colunas não pôde ser carregada (sem linhas para as UGs, as colunas continuam presentes)
+    if df_despesas.columns.empty or df_restos.columns.empty:
+        st.error("Erro: Dados não carregados corretamente. Verifique se os arquivos .parquet estão na pasta correta no Google Drive.")
+        return
+
+    if not required_columns_despesas.issubset(df_despesas.columns):
+        st.error(f"Erro: O dataset de despesas não contém todas as colunas necessárias: {required_columns_despesas}")
+        return
 
     # Definir um valor padrão para evitar erro caso a condição não seja atendida
     selected_ug_description = "Descrição não encontrada"
@@ -338,24 +326,18 @@ def run_dashboard():
 
     # ================= TAB 3: RESTOS A PAGAR =================
     with tab3:
-        # Converter colunas para numérico
-        for col in ["VALOR_INSCRITO", "VALOR_INSCRITO_EXE_ANTERIOR", "VALOR_CANCELADO", "VALOR_BLOQUEADO", "VALOR_PAGO", "VALOR_A_PAGAR"]:
-            df_restos_filtered[col] = pd.to_numeric(df_restos_filtered[col], errors="coerce").fillna(0)
-
-        # Criar uma cópia do DataFrame excluindo o mês 12 SOMENTE para VALOR_INSCRITO
-        df_restos_filtered_no_dezembro = df_restos_filtered[df_restos_filtered["MES"] != 12]
-
-        # Calcular valores agregados por ano (para todas as colunas, sem exceções)
-        df_restos_aggregated = df_restos_filtered.groupby("ANO").agg({
-            "VALOR_INSCRITO_EXE_ANTERIOR": "sum",
-            "VALOR_CANCELADO": "sum",
-            "VALOR_BLOQUEADO": "sum",
-            "VALOR_PAGO": "sum",
-            "VALOR_A_PAGAR": "sum"
-        }).reset_index()
-
-        # Agora adicionamos a soma de VALOR_INSCRITO apenas com meses 1 a 11
-        valor_inscrito_sem_mes_12 = df_restos_filtered_no_dezembro.groupby("ANO")["VALOR_INSCRITO"].sum().reset_index()
+        # Calcular valores agregados por ano, incluindo o mês 0 (para todas as colunas, sem exceções)
+        df_restos_aggregated = memoize(chave + ('restos',), lambda: aggregate(
+            df_restos, "ANO",
+            ["VALOR_INSCRITO_EXE_ANTERIOR", "VALOR_CANCELADO", "VALOR_BLOQUEADO", "VALOR_PAGO", "VALOR_A_PAGAR"],
+            **dict(filtros_consulta, ranges={"ANO": selected_ano, "MES": (0, 12)})
+        ))
+
+        # Agora adicionamos a soma de VALOR_INSCRITO excluindo o mês 12
+        valor_inscrito_sem_mes_12 = memoize(chave + ('restos_inscrito',), lambda: aggregate(
+            df_restos, "ANO", "VALOR_INSCRITO",
+            **dict(filtros_consulta, ranges={"ANO": selected_ano, "MES": (0, 11)})
+        ))
 
         # Mesclar as informações corretas no dataframe final
         df_restos_aggregated = df_restos_aggregated.merge(valor_inscrito_sem_mes_12, on="ANO", how="left")
@@ -456,30 +438,18 @@ def run_dashboard():
     # ================= TAB 4: EXECUÇÃO ORÇAMENTÁRIA =================
     with tab4:
 
-        # Garantir que UG e ANO são do mesmo tipo nos dataframes
-        df_despesas["UG"] = df_despesas["UG"].astype(str)
-        df_despesas["ANO"] = pd.to_numeric(df_despesas["ANO"], errors="coerce")
-
-        df_dotacao["UG"] = df_dotacao["UG"].astype(str)
-        df_dotacao["ANO"] = pd.to_numeric(df_dotacao["ANO"], errors="coerce")
-
-        selected_ugs_orcamento = [str(ug) for ug in selected_ugs_orcamento]
-        selected_ano = [int(selected_ano[0]), int(selected_ano[1])]
-
-        # Verificar se os filtros realmente estão funcionando corretamente
-        df_despesas_filtered = df_despesas[
-            (df_despesas["UG"].isin(selected_ugs_orcamento)) & 
-            (df_despesas["ANO"] >= selected_ano[0]) & 
-            (df_despesas["ANO"] <= selected_ano[1])
-        ]
+        # Agregar as despesas por ano a partir do cubo pré-agregado, com os filtros aplicados na própria consulta
+        df_despesas_agg = memoize(chave + ('despesas',), lambda: aggregate(
+            load_cube(anos=anos_selecionados), "ANO", ["VALOR_EMPENHADO", "VALOR_LIQUIDADO", "VALOR_PAGO"], **filtros_consulta
+        ))
 
         # Se ainda estiver vazio, mostrar quais UGs e ANOs deveriam ser filtrados
-        if df_despesas_filtered.empty:
+        if df_despesas_agg.empty:
             st.warning("⚠️ Não há dados disponíveis para exibição com os filtros aplicados.")
             st.write("🔍 Debug: Nenhum dado encontrado para UGs e ANO selecionados")
  
         # Verificar se os DataFrames filtrados estão vazios
-        if df_dotacao_filtered.empty or df_despesas_filtered.empty:
+        if df_dotacao_filtered.empty or df_despesas_agg.empty:
             st.warning("⚠️ Não há dados disponíveis para exibição com os filtros aplicados.")
         else:
             # Agregar valores por ano para cálculo da execução financeira
@@ -490,12 +460,6 @@ def run_dashboard():
                 "VALOR_ATUALIZADO": "sum"
             }).reset_index()
 
-            df_despesas_agg = df_despesas_filtered.groupby("ANO").agg({
-                "VALOR_EMPENHADO": "sum",
-                "VALOR_LIQUIDADO": "sum",
-                "VALOR_PAGO": "sum"
-            }).reset_index()
-
             # Mesclar os dados de execução financeira com os dados de despesas
             df_execucao_financeira = df_execucao_financeira.merge(df_despesas_agg, on="ANO", how="left").fillna(0)
 
@@ -0,0 +1,259 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+import threading
+import weakref
+from cache_manager import get_cached, put_cached
+
+# DuckDB é opcional: sem ele, as agregações são feitas em pandas com o mesmo resultado
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+config = st.secrets
+
+# Permite desligar o DuckDB pelo secrets sem desinstalar o pacote
+USE_DUCKDB = duckdb is not None and bool(config.get('USE_DUCKDB', True))
+
+# Uma conexão DuckDB por thread (cada sessão do Streamlit roda em sua própria thread)
+_thread_local = threading.local()
+
+# Função para obter a conexão DuckDB da thread atual, criando-a na primeira chamada
+def get_connection():
+    if not hasattr(_thread_local, 'connection'):
+        _thread_local.connection = duckdb.connect()
+    return _thread_local.connection
+
+# Função para colocar o nome de uma coluna entre aspas na consulta SQL
+def quote(column):
+    return '"' + str(column).replace('"', '""') + '"'
+
+# Função para converter escalares numpy (ex.: UGs vindas de df.unique()) em tipos Python aceitos como parâmetro
+def to_param(value):
+    return value.item() if hasattr(value, 'item') else value
+
+# Função para montar a cláusula WHERE e os parâmetros a partir dos filtros do sidebar
+def build_where(filters=None, ranges=None, not_null=None):
+    conditions, params = [], []
+    for col, values in (filters or {}).items():
+        values = [to_param(value) for value in values]
+        if not values:
+            conditions.append('FALSE')
+            continue
+        # Colunas categóricas viram ENUM no DuckDB; comparar como texto evita erro com valores fora do dicionário
+        column = f"CAST({quote(col)} AS VARCHAR)" if all(isinstance(value, str) for value in values) else quote(col)
+        conditions.append(f"{column} IN ({', '.join('?' for _ in values)})")
+        params.extend(values)
+    for col, (start, end) in (ranges or {}).items():
+        conditions.append(f"{quote(col)} BETWEEN ? AND ?")
+        params.extend([to_param(start), to_param(end)])
+    for col in not_null or []:
+        conditions.append(f"{quote(col)} IS NOT NULL")
+    return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+# Função para montar a máscara pandas equivalente aos filtros (usada quando o DuckDB não está disponível)
+def build_mask(df, filters=None, ranges=None, not_null=None):
+    mask = pd.Series(True, index=df.index)
+    for col, values in (filters or {}).items():
+        mask &= df[col].isin(list(values))
+    for col, (start, end) in (ranges or {}).items():
+        mask &= df[col].between(start, end)
+    for col in not_null or []:
+        mask &= df[col].notna()
+    return mask
+
+# Índices UG -> intervalos de linhas contíguas, por DataFrame (removidos quando o DataFrame é descartado)
+_ug_indexes = {}
+_ug_lock = threading.Lock()
+
+# Função para montar o índice de UG de um DataFrame ordenado por UG (ou formado por partições ordenadas):
+# cada sequência de linhas com a mesma UG vira um intervalo (início, fim)
+def build_ug_index(df):
+    values = df['UG'].fillna(-1).to_numpy(dtype='int64')
+    if len(values) == 0:
+        return {}
+    bounds = np.flatnonzero(values[1:] != values[:-1]) + 1
+    starts = np.concatenate(([0], bounds)).tolist()
+    stops = np.concatenate((bounds, [len(values)])).tolist()
+
+    index = {}
+    for start, stop in zip(starts, stops):
+        index.setdefault(int(values[start]), []).append((start, stop))
+    return index
+
+# Função para obter (ou montar uma única vez) o índice de UG de um DataFrame
+def get_ug_index(df):
+    key = id(df)
+    with _ug_lock:
+        if key in _ug_indexes:
+            return _ug_indexes[key]
+
+    index = build_ug_index(df)
+    with _ug_lock:
+        _ug_indexes[key] = index
+    weakref.finalize(df, _ug_indexes.pop, key, None)
+    return index
+
+# Função para selecionar as linhas das UGs pedidas por fatias do índice, sem varrer o DataFrame inteiro
+def select_ugs(df, ugs):
+    if 'UG' not in df.columns or not pd.api.types.is_integer_dtype(df['UG']):
+        return df[df['UG'].isin(list(ugs))]
+
+    index = get_ug_index(df)
+    ranges = sorted(r for ug in {int(to_param(ug)) for ug in ugs} for r in index.get(ug, []))
+    if not ranges:
+        return df.iloc[0:0]
+    if len(ranges) == 1:
+        return df.iloc[ranges[0][0]:ranges[0][1]]
+    return df.iloc[np.concatenate([np.arange(start, stop) for start, stop in ranges])]
+
+# Função para filtrar linhas com os mesmos filtros de aggregate: a UG é resolvida pelo índice
+# e os demais filtros são aplicados apenas às linhas das UGs selecionadas
+def filter_rows(df, filters=None, ranges=None, not_null=None):
+    filters = dict(filters or {})
+    ugs = filters.pop('UG', None)
+    if ugs is not None:
+        df = select_ugs(df, ugs)
+    if not filters and not ranges and not not_null:
+        return df
+    return df[build_mask(df, filters, ranges, not_null)]
+
+# Função para somar medidas agrupadas, aplicando os filtros do sidebar na própria consulta.
+# Com DuckDB, a varredura é vetorizada e paralela sobre o DataFrame em memória, sem criar cópias filtradas.
+# - group_by: coluna ou lista de colunas (lista vazia retorna uma única linha com os totais)
+# - measures: coluna ou lista de colunas somadas
+# - filters: {coluna: valores permitidos}; ranges: {coluna: (inicial, final)}; not_null: colunas sem nulos
+# - count_as: nome de uma coluna adicional com a quantidade de linhas de cada grupo
+def aggregate(df, group_by, measures, filters=None, ranges=None, not_null=None, count_as=None):
+    group_by = [group_by] if isinstance(group_by, str) else list(group_by)
+    measures = [measures] if isinstance(measures, str) else list(measures)
+
+    if USE_DUCKDB:
+        return aggregate_duckdb(df, group_by, measures, filters, ranges, not_null, count_as)
+    return aggregate_pandas(df, group_by, measures, filters, ranges, not_null, count_as)
+
+# Agregação com DuckDB sobre o DataFrame registrado como tabela temporária
+def aggregate_duckdb(df, group_by, measures, filters, ranges, not_null, count_as):
+    where, params = build_where(filters, ranges, list(not_null or []) + group_by)
+    select = [quote(col) for col in group_by]
+    select += [f"COALESCE(SUM({quote(col)}), 0) AS {quote(col)}" for col in measures]
+    if count_as:
+        select.append(f"COUNT(*) AS {quote(count_as)}")
+
+    query = f"SELECT {', '.join(select)} FROM dados{where}"
+    if group_by:
+        group_cols = ', '.join(quote(col) for col in group_by)
+        query += f" GROUP BY {group_cols} ORDER BY {group_cols}"
+
+    connection = get_connection()
+    connection.register('dados', df)
+    try:
+        return connection.execute(query, params).df()
+    finally:
+        connection.unregister('dados')
+
+# Agregação equivalente em pandas (apenas as colunas usadas são copiadas)
+def aggregate_pandas(df, group_by, measures, filters, ranges, not_null, count_as):
+    mask = build_mask(df, filters, ranges, not_null)
+    data = df.loc[mask, group_by + measures]
+
+    if not group_by:
+        totals = data[measures].sum().to_frame().T
+        if count_as:
+            totals[count_as] = len(data)
+        return totals
+
+    grouped = data.groupby(group_by, observed=True)
+    result = grouped[measures].sum()
+    if count_as:
+        result[count_as] = grouped.size()
+    return result.reset_index()
+
+# Função para montar o índice de somas acumuladas de um cubo (tabela de somas por UG sobre a grade ano x mês).
+# Os filtros e colunas sem nulos (exceto UG, ANO e MES) definem o escopo do índice.
+def build_prefix_index(cube, measures, filters=None, not_null=None):
+    data = cube.loc[build_mask(cube, filters, None, list(not_null or []) + ['UG', 'ANO', 'MES']), ['UG', 'ANO', 'MES'] + measures]
+
+    ugs = np.unique(data['UG'].to_numpy(dtype='int64'))
+    first_year = int(data['ANO'].min()) if len(data) else 0
+    n_years = int(data['ANO'].max()) - first_year + 1 if len(data) else 0
+
+    # Posição 0 de ano e de mês é o preenchimento com zeros; meses de 0 a 12 ocupam as posições 1 a 13
+    table = np.zeros((len(ugs), n_years + 1, 14, len(measures)))
+    np.add.at(
+        table,
+        (
+            np.searchsorted(ugs, data['UG'].to_numpy(dtype='int64')),
+            data['ANO'].to_numpy(dtype='int64') - first_year + 1,
+            data['MES'].to_numpy(dtype='int64') + 1,
+        ),
+        data[measures].to_numpy(dtype='float64', na_value=0.0)
+    )
+    table = table.cumsum(axis=1).cumsum(axis=2)
+
+    return {
+        'ugs': ugs,
+        'primeiro_ano': first_year,
+        'anos': n_years,
+        'medidas': measures,
+        'tabela': table,
+        'total': table.sum(axis=0),
+    }
+
+# Função para obter (ou montar e guardar no cache_manager) o índice de um cubo para o escopo informado.
+# - index_key: identifica o conteúdo do cubo (ex.: base, versão, anos carregados e classificação); com ela,
+#   o cubo pode ser uma função que o devolve, chamada apenas quando o índice precisa ser montado
+# - sem index_key, o índice fica associado ao próprio objeto do cubo, guardado junto para que seu id
+#   não seja reaproveitado enquanto o índice existir
+# Apenas as tabelas do índice contam para o teto de memória.
+def get_prefix_index(cube, measures, filters=None, not_null=None, index_key=None):
+    scope = tuple(sorted((col, tuple(sorted(values, key=repr))) for col, values in (filters or {}).items()))
+    owner = index_key if index_key is not None else id(cube)
+    key = ('indice_prefixo', owner, tuple(measures), scope, tuple(not_null or []))
+    cached = get_cached(key)
+    if cached is not None:
+        return cached[1]
+
+    data = cube() if callable(cube) else cube
+    index = build_prefix_index(data, measures, filters, not_null)
+    put_cached(key, (None if index_key is not None else data, index), index['tabela'].nbytes + index['total'].nbytes)
+    return index
+
+# Função para somar medidas de um cubo em um intervalo de anos e meses, para as UGs filtradas.
+# O índice é montado uma vez por cubo (ou por index_key) e escopo, cobrindo todos os anos do cubo; depois,
+# qualquer intervalo de anos e meses custa O(1) por UG selecionada (O(1) no total quando todas as UGs do
+# índice estão selecionadas), independentemente do volume de linhas. Retorna {medida: total}.
+def range_totals(cube, measures, filters=None, ranges=None, not_null=None, index_key=None):
+    measures = [measures] if isinstance(measures, str) else list(measures)
+    filters = dict(filters or {})
+    selected_ugs = filters.pop('UG', None)
+    ranges = ranges or {}
+
+    index = get_prefix_index(cube, measures, filters, not_null, index_key)
+    first_year, n_years = index['primeiro_ano'], index['anos']
+
+    start_year, end_year = ranges.get('ANO', (first_year, first_year + n_years - 1))
+    start_month, end_month = ranges.get('MES', (0, 12))
+    year_lo = min(max(int(start_year) - first_year, 0), n_years)
+    year_hi = min(max(int(end_year) - first_year + 1, 0), n_years)
+    month_lo = min(max(int(start_month), 0), 13)
+    month_hi = min(max(int(end_month) + 1, 0), 13)
+    if year_hi <= year_lo or month_hi <= month_lo:
+        return {measure: 0.0 for measure in measures}
+
+    if selected_ugs is None:
+        table = index['total'][np.newaxis]
+    else:
+        selected = np.unique(np.asarray([to_param(ug) for ug in selected_ugs]))
+        positions = np.searchsorted(index['ugs'], selected)
+        found = positions < len(index['ugs'])
+        found[found] = index['ugs'][positions[found]] == selected[found]
+        positions = positions[found]
+        table = index['total'][np.newaxis] if len(positions) == len(index['ugs']) else index['tabela'][positions]
+
+    totals = (
+        table[:, year_hi, month_hi] - table[:, year_lo, month_hi]
+        - table[:, year_hi, month_lo] + table[:, year_lo, month_lo]
+    ).sum(axis=0)
+    return dict(zip(measures, totals.tolist()))
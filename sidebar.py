@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 from chatbot import render_chatbot
+from auth_utils import is_admin
 from datetime import datetime, timedelta
 #from streamlit_option_menu import option_menu
 
@@ -8,7 +9,7 @@ def render_logout_button():
     if st.sidebar.button("Sair"):
         st.session_state.update(authenticated=False, data=None)
 
-def load_sidebar(df, dashboard_name):
+def load_sidebar(df, dashboard_name, anos=None):
     # Exibe o botão de logout no sidebar
     render_logout_button()
 
@@ -82,9 +83,7 @@ def load_sidebar(df, dashboard_name):
     #     return selected_ugs, selected_ano, selected_mes
     # ========= FILTROS DO DASHBOARD DE ADIANTAMENTOS =========
     if dashboard_name == "Adiantamentos":
-        # Normalizar os nomes das colunas para evitar problemas de case sensitivity
-        df.columns = df.columns.str.strip().str.upper()
-
+        # Nomes das colunas e tipos já normalizados na carga (data_loader.normalize_frame)
         required_columns = {"ANO", "UG", "DESCRICAO_UG", "NUM_MES"}
 
         # Verifica se todas as colunas necessárias existem no dataset
@@ -146,8 +145,6 @@ def load_sidebar(df, dashboard_name):
         # ==========================
         # SLIDER PARA MÊS
         # ==========================
-        df["NUM_MES"] = df["NUM_MES"].astype(int)
-
         min_mes = 1
         max_mes = 12
 
@@ -164,9 +161,7 @@ def load_sidebar(df, dashboard_name):
 
     # ========= FILTROS DO DASHBOARD DE ORÇAMENTO =========
     if dashboard_name == "Orçamento":
-        # Normalizar os nomes das colunas para evitar problemas de case sensitivity
-        df.columns = df.columns.str.strip().str.upper()
-
+        # Nomes das colunas e tipos já normalizados na carga (data_loader.normalize_frame)
         required_columns = {"ANO", "UG", "DESCRICAO_UG", "MES"}
 
         # Verifica se todas as colunas necessárias existem no dataset
@@ -627,10 +622,7 @@ def load_sidebar(df, dashboard_name):
                 int(option.split(" - ")[0]) for option in selected_ug_sigla_contratos
             ]
 
-        # Conversão de timestamps para datetime
-        df['DATA_INICIO_VIGENCIA'] = pd.to_datetime(df['DATA_INICIO_VIGENCIA'], unit='ms')
-        df['DATA_FIM_VIGENCIA'] = pd.to_datetime(df['DATA_FIM_VIGENCIA'], unit='ms')
-
+        # DATA_INICIO_VIGENCIA e DATA_FIM_VIGENCIA já chegam como datetime do data_loader
         today = datetime.today().date()
 
         # Opções para filtros rápidos de períodos
@@ -720,17 +712,25 @@ def load_sidebar(df, dashboard_name):
         selected_ugs = [int(option.split(" - ")[0]) for option in selected_ug_sigla]
 
         # Filtrar pelo ano e mês
-        min_ano = int(df['ANO'].min())
-        max_ano = int(df['ANO'].max())
+        if anos:
+            # Anos disponíveis informados pela página (os dados de cada ano são carregados sob demanda)
+            min_ano = int(min(anos))
+            max_ano = int(max(anos))
+        else:
+            min_ano = int(df['ANO'].min())
+            max_ano = int(df['ANO'].max())
 
         if min_ano == max_ano:
             min_ano = max_ano - 1  # Ajustar para evitar erro no slider
 
+        # Com carga sob demanda, começar pelos dois últimos anos para a primeira exibição ser rápida
+        ano_inicial = max(min_ano, max_ano - 1) if anos else min_ano
+
         selected_ano = st.sidebar.slider(
             'Selecione o Ano:',
             min_value=min_ano,
             max_value=max_ano,
-            value=(min_ano, max_ano)
+            value=(ano_inicial, max_ano)
         )
 
         min_mes = 1
@@ -749,9 +749,15 @@ def load_sidebar(df, dashboard_name):
     render_chatbot()
 
 def navigate_pages():
+    pages = ('Início', 'Despesas Detalhado', 'Diárias', 'Contratos', 'Servidores','Orçamento','Adiantamentos') #, 'Combustível', )
+
+    # A página de diagnóstico só aparece para os administradores
+    if is_admin():
+        pages += ('Diagnóstico',)
+
     page = st.sidebar.radio(
         'Navegação',
-        ('Início', 'Despesas Detalhado', 'Diárias', 'Contratos', 'Servidores','Orçamento','Adiantamentos'), #, 'Combustível', ),
+        pages,
     )
     
     return page
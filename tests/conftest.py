@@ -0,0 +1,9 @@
+import os
+import sys
+
+import streamlit as st
+
+# Os módulos do painel leem st.secrets ao serem importados; nos testes, usam-se os valores padrão
+st.secrets = {}
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
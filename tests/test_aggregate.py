@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import query_engine
+from query_engine import aggregate
+
+
+# Base pequena com coluna categórica, UGs inteiras e nulos nas colunas de agrupamento
+def make_frame(seed=0, rows=400):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        'UG': rng.choice([10, 20, 30], rows),
+        'ANO': rng.integers(2021, 2024, rows),
+        'MES': rng.integers(1, 13, rows),
+        'PODER': pd.Categorical(rng.choice(['EXE', 'LEG', 'JUD'], rows)),
+        'DESCRICAO_FUNCAO': pd.Categorical(rng.choice(['SAUDE', 'EDUCACAO', None], rows)),
+        'VALOR_PAGO': rng.uniform(0, 1000, rows),
+        'VALOR_EMPENHADO': rng.uniform(0, 1000, rows),
+    })
+    return frame
+
+
+# Resultado esperado com um groupby pandas simples (sem o query_engine)
+def expected_groupby(frame, group_by, measures, filters, ranges, count_as):
+    mask = pd.Series(True, index=frame.index)
+    for col, values in filters.items():
+        mask &= frame[col].isin(values)
+    for col, (start, end) in ranges.items():
+        mask &= frame[col].between(start, end)
+    data = frame[mask]
+    if not group_by:
+        totals = {measure: data[measure].sum() for measure in measures}
+        totals[count_as] = len(data)
+        return pd.DataFrame([totals])
+    data = data.dropna(subset=group_by)
+    grouped = data.groupby(group_by, observed=True)
+    result = grouped[measures].sum()
+    result[count_as] = grouped.size()
+    return result.reset_index()
+
+
+# Compara resultados ignorando tipos (ENUM/categoria x texto, int32 x int64) e a ordem das linhas
+def assert_same(result, expected, group_by):
+    assert list(result.columns) == list(expected.columns)
+    result, expected = result.copy(), expected.copy()
+    for col in group_by:
+        result[col] = result[col].astype(str)
+        expected[col] = expected[col].astype(str)
+    result = result.sort_values(group_by).reset_index(drop=True) if group_by else result
+    expected = expected.sort_values(group_by).reset_index(drop=True) if group_by else expected
+    assert len(result) == len(expected)
+    for col in result.columns:
+        if col in group_by:
+            assert result[col].tolist() == expected[col].tolist()
+        else:
+            np.testing.assert_allclose(result[col].astype(float), expected[col].astype(float))
+
+
+@pytest.fixture(params=['pandas', 'duckdb'])
+def engine(request, monkeypatch):
+    if request.param == 'duckdb':
+        pytest.importorskip('duckdb')
+    monkeypatch.setattr(query_engine, 'USE_DUCKDB', request.param == 'duckdb')
+    return request.param
+
+
+@pytest.mark.parametrize('group_by', [['DESCRICAO_FUNCAO'], ['ANO', 'PODER'], []])
+@pytest.mark.parametrize('filters', [
+    {'PODER': ['EXE', 'LEG']},
+    {'PODER': ['EXE', 'FORA_DO_DICIONARIO'], 'UG': [10, 30]},
+    {'UG': []},
+])
+def test_aggregate_matches_pandas_groupby(engine, group_by, filters):
+    frame = make_frame()
+    ranges = {'ANO': (2022, 2023), 'MES': (2, 11)}
+    measures = ['VALOR_PAGO', 'VALOR_EMPENHADO']
+
+    result = aggregate(frame, group_by, measures, filters=filters, ranges=ranges, count_as='QUANTIDADE')
+    expected = expected_groupby(frame, group_by, measures, filters, ranges, 'QUANTIDADE')
+    assert_same(result, expected, group_by)
+
+
+def test_aggregate_totals_are_zero_when_nothing_matches(engine):
+    result = aggregate(make_frame(), [], 'VALOR_PAGO', filters={'UG': []}, count_as='QUANTIDADE')
+    assert result['VALOR_PAGO'].tolist() == [0.0]
+    assert result['QUANTIDADE'].tolist() == [0]
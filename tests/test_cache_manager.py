@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cache_manager import estimate_size, normalize_key
+
+
+def test_normalize_key_ignores_selection_order():
+    first = normalize_key({'filters': {'UG': [20, 10], 'PODER': ['EXE']}, 'ranges': {'ANO': (2020, 2023)}})
+    second = normalize_key({'ranges': {'ANO': (2020, 2023)}, 'filters': {'PODER': ['EXE'], 'UG': [10, 20]}})
+    assert first == second
+    hash(first)
+
+
+def test_normalize_key_converts_numpy_scalars_and_sets():
+    assert normalize_key([np.int64(3), 1, 3]) == (1, 3)
+    assert normalize_key({np.int64(2), 1}) == (1, 2)
+    assert normalize_key((np.float64(1.5), 'a')) == (1.5, 'a')
+    assert normalize_key(range(2019, 2024)) == ('range', 2019, 2024, 1)
+
+
+@pytest.mark.parametrize('filtered', [False, True])
+def test_estimate_size_is_close_to_deep_memory_usage(filtered):
+    rng = np.random.default_rng(0)
+    rows = 20000
+    frame = pd.DataFrame({f'VALOR_{idx}': rng.uniform(0, 1000, rows) for idx in range(10)})
+    frame['UG'] = rng.integers(1, 500, rows)
+    frame['NOME_FAVORECIDO'] = rng.choice(['EMPRESA A LTDA', 'FORNECEDOR B', 'C'], rows).astype(object)
+    frame['PODER'] = pd.Categorical(rng.choice(['EXE', 'LEG', 'JUD'], rows))
+    if filtered:
+        # Resultados de select_ugs/filter_rows têm um índice de inteiros, não um RangeIndex
+        frame = frame[frame['UG'] % 3 == 0]
+
+    actual = frame.memory_usage(deep=True).sum()
+    assert estimate_size(frame) == pytest.approx(actual, rel=0.05)
+    assert estimate_size(frame['VALOR_0']) == pytest.approx(frame['VALOR_0'].memory_usage(deep=True), rel=0.01)
@@ -0,0 +1,8 @@
+import pandas as pd
+
+from data_loader import build_credentials
+
+
+def test_build_credentials_strips_usernames_and_keeps_first_row():
+    df = pd.DataFrame({'username': [' ana ', 'bruno', 'ana', 123], 'password': [1, 2, 3, 4]})
+    assert build_credentials(df) == {'ana': 1, 'bruno': 2, '123': 4}
@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_loader
+
+
+# Partição anual de despesas já normalizada e ordenada por UG, como as guardadas pelo data_loader
+def make_partition(year, rows=300, seed=0):
+    rng = np.random.default_rng(seed + year)
+    frame = pd.DataFrame({
+        'UG': rng.choice([10, 20, 30], rows),
+        'UO': rng.choice([1.0, np.nan], rows),
+        'ANO': year,
+        'MES': rng.integers(1, 13, rows),
+        'PODER': pd.Categorical(rng.choice(['EXE', 'LEG'], rows)),
+        'DESCRICAO_FUNCAO': pd.Categorical(rng.choice([f'FUNCAO {year}', 'SAUDE'], rows)),
+        'VALOR_EMPENHADO': rng.uniform(0, 100, rows),
+        'VALOR_LIQUIDADO': rng.uniform(0, 100, rows),
+        'VALOR_PAGO': rng.uniform(0, 100, rows),
+    })
+    return frame.sort_values('UG', kind='stable', ignore_index=True)
+
+
+# Manifesto e partições em memória de dois anos, sem Drive e sem projeção declarada
+@pytest.fixture
+def loaded_years(monkeypatch):
+    partitions = {2022: make_partition(2022), 2023: make_partition(2023)}
+    monkeypatch.setattr(data_loader, '_dataset_columns', {})
+    monkeypatch.setitem(data_loader._manifests, 'despesas', {
+        'files': [{'id': str(year), 'name': f'{year}.parquet', 'ano': year} for year in partitions],
+        'versao': 'teste',
+    })
+    monkeypatch.setattr(data_loader, '_partitions', {
+        ('despesas', None, year): frame for year, frame in partitions.items()
+    })
+    monkeypatch.setattr(data_loader, '_cubes', {
+        ('despesas', None, year): data_loader.build_cubes('despesas', frame) for year, frame in partitions.items()
+    })
+    return partitions
+
+
+def test_empty_frame_keeps_columns_and_canonical_dtypes(loaded_years):
+    frame = data_loader.empty_frame('despesas', ['ug', 'ANO', 'PODER', 'VALOR_PAGO'])
+    assert frame.empty
+    assert frame.dtypes.astype(str).to_dict() == {
+        'UG': 'int64', 'ANO': 'int64', 'PODER': 'object', 'VALOR_PAGO': 'float64'
+    }
+
+
+def test_years_without_partitions_return_typed_empty_frames(loaded_years):
+    partitions = data_loader.assemble_partitions('despesas', [2030])
+    assert partitions.empty and {'UG', 'ANO', 'MES', 'PODER', 'VALOR_PAGO'} <= set(partitions.columns)
+
+    cube = data_loader.assemble_cube('despesas', 'DESCRICAO_FUNCAO', [2030])
+    assert cube.empty
+    assert list(cube.columns) == [
+        'UG', 'UO', 'ANO', 'MES', 'PODER', 'DESCRICAO_FUNCAO',
+        'VALOR_EMPENHADO', 'VALOR_LIQUIDADO', 'VALOR_PAGO', 'QUANTIDADE'
+    ]
+
+    filtered = data_loader.filter_partitions('despesas', [2030], filters={'UG': [10]})
+    assert filtered.empty and 'UG' in filtered.columns
+
+
+def test_filter_partitions_matches_filtering_the_assembled_years(loaded_years):
+    filters = {'UG': [30, 10], 'PODER': ['EXE']}
+    ranges = {'ANO': (2022, 2023), 'MES': (3, 9)}
+
+    filtered = data_loader.filter_partitions('despesas', [2022, 2023], filters, ranges, ['UO'])
+
+    full = pd.concat(loaded_years.values(), ignore_index=True)
+    mask = (
+        full['UG'].isin([10, 30]) & (full['PODER'] == 'EXE') & full['MES'].between(3, 9) & full['UO'].notna()
+    )
+    expected = full[mask]
+    assert len(filtered) == len(expected)
+    assert filtered['VALOR_PAGO'].sum() == pytest.approx(expected['VALOR_PAGO'].sum())
+    assert isinstance(filtered['DESCRICAO_FUNCAO'].dtype, pd.CategoricalDtype)
+
+
+def test_concat_frames_keeps_categoricals_with_different_categories():
+    first = pd.DataFrame({'PODER': pd.Categorical(['EXE', 'LEG']), 'VALOR_PAGO': [1.0, 2.0]})
+    second = pd.DataFrame({'PODER': pd.Categorical(['JUD', 'EXE']), 'VALOR_PAGO': [3.0, 4.0]})
+
+    data = data_loader.concat_frames([first, second])
+    assert isinstance(data['PODER'].dtype, pd.CategoricalDtype)
+    assert data['PODER'].tolist() == ['EXE', 'LEG', 'JUD', 'EXE']
+    assert set(data['PODER'].cat.categories) == {'EXE', 'LEG', 'JUD'}
+    assert data['VALOR_PAGO'].tolist() == [1.0, 2.0, 3.0, 4.0]
+    assert data.index.tolist() == [0, 1, 2, 3]
+
+
+def test_concat_frames_falls_back_to_pandas_when_columns_differ():
+    first = pd.DataFrame({'UG': [1], 'PODER': pd.Categorical(['EXE'])})
+    second = pd.DataFrame({'PODER': pd.Categorical(['LEG']), 'UG': [2]})
+
+    data = data_loader.concat_frames([first, second])
+    assert data['UG'].tolist() == [1, 2]
+    assert data['PODER'].astype(str).tolist() == ['EXE', 'LEG']
+    assert data_loader.concat_frames([first]) is first
+
+
+def test_to_integer_uses_nullable_int_only_when_needed():
+    assert data_loader.to_integer(pd.Series(['1', '2'])).dtype == 'int64'
+    converted = data_loader.to_integer(pd.Series(['1', 'x', None]))
+    assert converted.dtype == 'Int64'
+    assert converted.tolist()[0] == 1 and converted.isna().tolist() == [False, True, True]
+    series = pd.Series([1, 2], dtype='int32')
+    assert data_loader.to_integer(series) is series
+
+
+def test_normalize_frame_applies_canonical_types():
+    df = pd.DataFrame({
+        ' ug ': ['10', '20'],
+        'Percentual': ['12.5%', '50%'],
+        'data_publicacao': ['01/02/2024', 'invalida'],
+        'valor_pago': ['1.5', 'x'],
+        'descricao': ['a', 'b'],
+    })
+    tipos = {
+        'inteiros': ['UG'],
+        'percentuais': ['PERCENTUAL'],
+        'datas': {'DATA_PUBLICACAO': {'format': '%d/%m/%Y'}},
+        'monetarios': True,
+    }
+
+    data = data_loader.normalize_frame(df, tipos)
+    assert list(data.columns) == ['UG', 'PERCENTUAL', 'DATA_PUBLICACAO', 'VALOR_PAGO', 'DESCRICAO']
+    assert data['UG'].dtype == 'int64' and data['UG'].tolist() == [10, 20]
+    assert data['PERCENTUAL'].tolist() == pytest.approx([0.125, 0.5])
+    assert data['DATA_PUBLICACAO'].iloc[0] == pd.Timestamp('2024-02-01') and pd.isna(data['DATA_PUBLICACAO'].iloc[1])
+    assert data['VALOR_PAGO'].dtype == 'float64' and data['VALOR_PAGO'].iloc[0] == 1.5
+    assert data['VALOR_PAGO'].isna().iloc[1]
+    assert data['DESCRICAO'].tolist() == ['a', 'b']
+
+
+def test_manifest_version_changes_with_content_or_file_set():
+    files = [
+        {'id': 'a', 'md5Checksum': '1', 'modifiedTime': '2024-01-01T00:00:00.000Z', 'ano': 2023},
+        {'id': 'b', 'md5Checksum': '2', 'modifiedTime': '2024-01-02T00:00:00.000Z', 'ano': 2024},
+    ]
+    version = data_loader.manifest_version(files)
+    assert version == data_loader.manifest_version([dict(file) for file in files])
+    assert version != data_loader.manifest_version([files[0], dict(files[1], md5Checksum='3')])
+    assert version != data_loader.manifest_version([files[0], dict(files[1], modifiedTime='2024-02-01T00:00:00.000Z')])
+    assert version != data_loader.manifest_version(files[:1])
+
+
+def test_changed_partitions_lists_only_years_that_differ():
+    current = [
+        {'id': 'a', 'md5Checksum': '1', 'ano': 2022},
+        {'id': 'b', 'md5Checksum': '2', 'ano': 2023},
+        {'id': 'c', 'md5Checksum': '3', 'ano': 2023},
+        {'id': 'd', 'md5Checksum': '4', 'ano': 2024},
+    ]
+    new = [
+        {'id': 'a', 'md5Checksum': '1', 'ano': 2022},
+        {'id': 'b', 'md5Checksum': '2', 'ano': 2023},
+        {'id': 'c', 'md5Checksum': '9', 'ano': 2023},
+        {'id': 'e', 'md5Checksum': '5', 'ano': 2025},
+    ]
+    versions = data_loader.partition_versions(current)
+    assert set(versions) == {2022, 2023, 2024}
+    assert versions[2023] == data_loader.manifest_version(current[1:3])
+
+    assert data_loader.changed_partitions(current, new) == {2023, 2024, 2025}
+    assert data_loader.changed_partitions(current, current) == set()
+
+
+def test_build_cube_sums_measures_and_counts_rows():
+    frame = pd.DataFrame({
+        'UG': [10, 10, 10, 20],
+        'UO': [1.0, 1.0, np.nan, 2.0],
+        'ANO': 2024,
+        'MES': [1, 1, 1, 2],
+        'PODER': pd.Categorical(['EXE', 'EXE', 'EXE', 'LEG']),
+        'DESCRICAO_FUNCAO': pd.Categorical(['SAUDE', 'SAUDE', 'SAUDE', 'EDUCACAO']),
+        'VALOR_EMPENHADO': [1.0, 2.0, 3.0, 4.0],
+        'VALOR_LIQUIDADO': [1.0, 1.0, 1.0, 1.0],
+        'VALOR_PAGO': [10.0, 20.0, 30.0, 40.0],
+    })
+
+    cube = data_loader.build_cube('despesas', frame, ('DESCRICAO_FUNCAO',))
+    assert list(cube.columns) == [
+        'UG', 'UO', 'ANO', 'MES', 'PODER', 'DESCRICAO_FUNCAO',
+        'VALOR_EMPENHADO', 'VALOR_LIQUIDADO', 'VALOR_PAGO', 'QUANTIDADE'
+    ]
+    # A linha com UO nula continua no cubo, em um grupo próprio
+    assert len(cube) == 3
+    assert cube['VALOR_PAGO'].sum() == frame['VALOR_PAGO'].sum()
+    assert cube['QUANTIDADE'].sum() == len(frame)
+    grupo = cube[(cube['UG'] == 10) & (cube['UO'] == 1.0)]
+    assert grupo['VALOR_PAGO'].tolist() == [30.0] and grupo['QUANTIDADE'].tolist() == [2]
+
+    # Classificação fora da projeção carregada: não há cubo
+    assert data_loader.build_cube('despesas', frame, ('DESCRICAO_FONTE',)) is None
+    assert ('DESCRICAO_FONTE',) not in data_loader.build_cubes('despesas', frame)
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from query_engine import range_totals
+
+
+# Cubo pequeno, ordenado por UG, com os campos usados pelas páginas de despesas
+def make_cube(seed=0, rows=500):
+    rng = np.random.default_rng(seed)
+    cube = pd.DataFrame({
+        'UG': rng.choice([10, 20, 30, 40], rows),
+        'ANO': rng.integers(2019, 2024, rows),
+        'MES': rng.integers(0, 13, rows),
+        'PODER': rng.choice(['EXE', 'LEG'], rows),
+        'UO': rng.choice([1.0, 2.0, np.nan], rows),
+        'VALOR_PAGO': rng.uniform(0, 1000, rows).round(2),
+        'QUANTIDADE': rng.integers(1, 5, rows),
+    })
+    return cube.sort_values('UG', kind='stable').reset_index(drop=True)
+
+
+# Soma direta no DataFrame, usada como referência para o índice de somas acumuladas
+def brute_force(cube, measures, filters, ranges, not_null):
+    mask = pd.Series(True, index=cube.index)
+    for col, values in filters.items():
+        mask &= cube[col].isin(values)
+    for col, (start, end) in ranges.items():
+        mask &= cube[col].between(start, end)
+    for col in not_null:
+        mask &= cube[col].notna()
+    return {measure: cube.loc[mask, measure].sum() for measure in measures}
+
+
+@pytest.mark.parametrize('ugs', [None, [20], [40, 10], [10, 20, 30, 40], [99], []])
+@pytest.mark.parametrize('anos', [(2019, 2023), (2020, 2021), (2022, 2022), (2015, 2030), (2024, 2030)])
+@pytest.mark.parametrize('meses', [(0, 12), (3, 7), (12, 12)])
+def test_range_totals_matches_brute_force(ugs, anos, meses):
+    cube = make_cube()
+    filters = {'PODER': ['EXE']}
+    if ugs is not None:
+        filters['UG'] = ugs
+    ranges = {'ANO': anos, 'MES': meses}
+    not_null = ['UO']
+
+    result = range_totals(cube, ['VALOR_PAGO', 'QUANTIDADE'], filters=filters, ranges=ranges, not_null=not_null)
+    expected = brute_force(cube, ['VALOR_PAGO', 'QUANTIDADE'], filters, ranges, not_null)
+    assert result == pytest.approx(expected)
+
+
+def test_range_totals_accepts_single_measure_and_empty_range():
+    cube = make_cube(1)
+    assert list(range_totals(cube, 'VALOR_PAGO')) == ['VALOR_PAGO']
+    assert range_totals(cube, 'VALOR_PAGO', ranges={'ANO': (2023, 2020)}) == {'VALOR_PAGO': 0.0}
+
+
+def test_range_totals_builds_keyed_index_once():
+    cube = make_cube(2)
+    calls = []
+
+    def load():
+        calls.append(1)
+        return cube
+
+    key = ('teste', 'versao-1')
+    for anos in [(2019, 2023), (2020, 2021), (2022, 2023)]:
+        result = range_totals(load, 'VALOR_PAGO', ranges={'ANO': anos}, index_key=key)
+        assert result == pytest.approx(brute_force(cube, ['VALOR_PAGO'], {}, {'ANO': anos}, []))
+    assert len(calls) == 1
+
+    range_totals(load, 'VALOR_PAGO', index_key=('teste', 'versao-2'))
+    assert len(calls) == 2
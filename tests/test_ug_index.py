@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from query_engine import build_ug_index, filter_rows, select_ugs
+
+
+# Partição pequena, ordenada por UG, como as montadas pelo data_loader
+def make_partition(seed=0, rows=500):
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        'UG': rng.choice([10, 20, 30, 40], rows),
+        'ANO': rng.integers(2019, 2024, rows),
+        'PODER': rng.choice(['EXE', 'LEG'], rows),
+        'UO': rng.choice([1.0, 2.0, np.nan], rows),
+        'VALOR_PAGO': rng.uniform(0, 1000, rows).round(2),
+    })
+    return frame.sort_values('UG', kind='stable').reset_index(drop=True)
+
+
+def test_build_ug_index_groups_contiguous_runs():
+    df = pd.DataFrame({'UG': [10, 10, 20, 20, 20, 10, None]})
+    assert build_ug_index(df) == {10: [(0, 2), (5, 6)], 20: [(2, 5)], -1: [(6, 7)]}
+    assert build_ug_index(df.iloc[0:0]) == {}
+
+
+def test_select_ugs_and_filter_rows():
+    frame = make_partition(3)
+    selected = select_ugs(frame, [30, 10])
+    pd.testing.assert_frame_equal(selected, frame[frame['UG'].isin([10, 30])])
+    assert select_ugs(frame, [99]).empty
+
+    filtered = filter_rows(frame, {'UG': [20], 'PODER': ['LEG']}, {'ANO': (2020, 2021)}, ['UO'])
+    mask = (frame['UG'] == 20) & (frame['PODER'] == 'LEG') & frame['ANO'].between(2020, 2021) & frame['UO'].notna()
+    pd.testing.assert_frame_equal(filtered, frame[mask])